@@ -15,6 +15,35 @@ function colorDMC() {
   }
 }
 
+// Batched mode: one read and one setBackgrounds() call for the whole
+// sheet instead of a service round-trip per row.
+function colorDMCBatch() {
+  colorRowsBatch(3, 7); // R, G, B in columns C-E, swatch in column G
+}
+
+// Same for an imported *_legend.csv: r, g, b in columns B-D, swatch
+// written to the first empty column after the legend.
+function colorLegendBatch() {
+  const sheet = SpreadsheetApp.getActiveSpreadsheet().getActiveSheet();
+  colorRowsBatch(2, sheet.getLastColumn() + 1);
+}
+
+function colorRowsBatch(rgbColumn, swatchColumn) {
+  const sheet = SpreadsheetApp.getActiveSpreadsheet().getActiveSheet();
+  const rows = sheet.getLastRow() - 1;
+  if (rows < 1) return;
+
+  const values = sheet.getRange(2, rgbColumn, rows, 3).getValues();
+  const backgrounds = values.map(function (row) {
+    const r = parseInt(row[0], 10);
+    const g = parseInt(row[1], 10);
+    const b = parseInt(row[2], 10);
+    if (isNaN(r) || isNaN(g) || isNaN(b)) return [null]; // no fill
+    return [rgbToHex(r, g, b)];
+  });
+  sheet.getRange(2, swatchColumn, rows, 1).setBackgrounds(backgrounds);
+}
+
 function rgbToHex(r, g, b) {
   return "#" +
     toHex(r) +
@@ -0,0 +1,495 @@
+"""
+Headless batch mode: turn a folder (or manifest) of images into patterns
+without the Tk GUI.
+
+    python3 needlepoint_batch.py photos/ --out patterns/ --grid-max 120 --colors 30
+    python3 needlepoint_batch.py --manifest jobs.jsonl --jobs 4
+
+A manifest is a JSON-lines file, one object per image:
+
+    {"image": "cat.jpg", "grid_max": 200, "color_count": 50, "tiled": true}
+
+Any setting left out of a manifest line falls back to the command line.
+Relative image paths are resolved against the manifest's folder.
+
+Each image runs compute_grid -> legend -> color/symbol PDFs (and, with
+--outputs ...,workbook,project, a colored legend .xlsx and a .loom project
+file) in a process pool. Saved .loom projects can be given instead of
+images; they are exported from their stored grid without re-quantizing.
+The DMC palette is loaded once and shared read-only with the workers.
+Failures are reported per image and don't stop the batch.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import needlepoint_designer_plus as nd
+
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff", ".gif")
+
+OUTPUTS = ("legend", "workbook", "color", "symbols", "project")
+
+# Settings a manifest line may override, with their command-line defaults
+DEFAULT_SETTINGS = {
+    "grid_max": 160,
+    "color_count": 40,
+    "cell_px": 18,
+    "keep_aspect": True,
+    "include_dmc": True,
+    "regular_only": False,
+    "distance": "rgb",
+    "quantizer": "adaptive",
+    "dither": "none",
+    "high_quality": False,
+    "cleanup": 0.0,
+    "outputs": ["legend", "color", "symbols"],
+    "tiled": False,
+    "backend": "raster",
+    "strands": nd.SKEIN_STRANDS,
+    "legend_stats": True,
+}
+
+# Allowed values of the enum-like settings, and (min, max) of numeric ones
+SETTING_CHOICES = {
+    "distance": nd.DISTANCE_MODES,
+    "quantizer": nd.QUANTIZERS,
+    "dither": nd.DITHER_MODES,
+    "backend": nd.PDF_BACKENDS,
+}
+SETTING_RANGES = {
+    "grid_max": (1, 4000),
+    "color_count": (1, 256),
+    "cell_px": (1, 100),
+    "cleanup": (0.0, 1.0),
+    "strands": (1, nd.SKEIN_STRANDS),
+}
+
+
+def check_setting(name, value):
+    """
+    value if it suits setting `name`: the type of its DEFAULT_SETTINGS
+    entry (an int is fine for a float), one of SETTING_CHOICES, within
+    SETTING_RANGES, and for outputs a list of OUTPUTS names. Raises
+    ValueError otherwise.
+    """
+    default = DEFAULT_SETTINGS[name]
+    if isinstance(default, bool):
+        ok = isinstance(value, bool)
+    elif isinstance(default, int):
+        ok = isinstance(value, int) and not isinstance(value, bool)
+    elif isinstance(default, float):
+        ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+        value = float(value) if ok else value
+    elif isinstance(default, list):
+        ok = isinstance(value, list) and all(isinstance(v, str) for v in value)
+    else:
+        ok = isinstance(value, str)
+    if not ok:
+        raise ValueError(f"{name} must be {type(default).__name__}, not {value!r}")
+    if name in SETTING_CHOICES and value not in SETTING_CHOICES[name]:
+        raise ValueError(f"{name} must be one of: {', '.join(SETTING_CHOICES[name])}")
+    if name in SETTING_RANGES:
+        lo, hi = SETTING_RANGES[name]
+        if not lo <= value <= hi:  # also rejects nan
+            raise ValueError(f"{name} must be between {lo} and {hi}")
+    if name == "outputs":
+        bad = set(value) - set(OUTPUTS)
+        if bad:
+            raise ValueError(f"unknown outputs: {', '.join(sorted(bad))}")
+    return value
+
+
+# ============================================================
+#  JOB DISCOVERY
+# ============================================================
+
+def find_images(path):
+    """
+    Image files directly inside a folder (sorted), or [path] for a file.
+    """
+    if os.path.isdir(path):
+        return [
+            os.path.join(path, name)
+            for name in sorted(os.listdir(path))
+            if name.lower().endswith(IMAGE_EXTS + (nd.PROJECT_EXT,))
+        ]
+    return [path]
+
+
+def read_manifest(manifest_path, defaults):
+    """
+    One job per non-blank manifest line: defaults overlaid with the line.
+    Raises ValueError for unreadable lines and unknown or invalid settings.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    with open(manifest_path, encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+                image = entry.pop("image")
+            except (ValueError, KeyError) as e:
+                raise ValueError(f"{manifest_path}:{lineno}: bad manifest line ({e})")
+            unknown = set(entry) - set(DEFAULT_SETTINGS)
+            if unknown:
+                raise ValueError(
+                    f"{manifest_path}:{lineno}: unknown settings {sorted(unknown)}"
+                )
+            settings = dict(defaults)
+            for name, value in entry.items():
+                try:
+                    settings[name] = check_setting(name, value)
+                except ValueError as e:
+                    raise ValueError(f"{manifest_path}:{lineno}: {e}")
+            jobs.append((os.path.join(base_dir, image), settings))
+    return jobs
+
+
+# ============================================================
+#  WORKER
+# ============================================================
+
+def _init_worker(palette_path, stats_log=None):
+    """
+    Pool initializer. With fork the parent's compiled palette is inherited
+    as-is; with spawn (macOS/Windows) each worker loads it once. Workers
+    append their stage events to the shared stats log, if any.
+    """
+    if not nd.DMC_PALETTE and palette_path:
+        nd.load_dmc_palette(palette_path)
+    if stats_log:
+        nd.STATS.set_log(stats_log)
+
+
+def run_job(image_path, settings, out_dir):
+    """
+    Run one image through the pipeline. Never raises: returns a result dict
+    with status "ok" or "error", per-stage timings (seconds) and outputs.
+    """
+    result = {
+        "image": image_path,
+        "status": "ok",
+        "error": "",
+        "timings": {},
+        "outputs": {},
+    }
+    timings = result["timings"]
+    t_start = time.perf_counter()
+
+    try:
+        t0 = time.perf_counter()
+        stored = {}
+        if image_path.lower().endswith(nd.PROJECT_EXT):
+            # Saved project: export straight from its (memory-mapped) grid,
+            # with its saved symbols and (if still applicable) DMC threads
+            pattern, meta = nd.load_project(image_path)
+            stored = nd.project_legend_map(
+                meta, allow_specialty=not settings["regular_only"], distance=settings["distance"]
+            )
+            size = (pattern.width, pattern.height)
+        else:
+            _, pattern, size = nd.compute_grid(
+                image_path,
+                settings["grid_max"],
+                settings["color_count"],
+                keep_aspect=settings["keep_aspect"],
+                quantizer=settings["quantizer"],
+                allow_specialty=not settings["regular_only"],
+                dither=settings["dither"],
+                high_quality=settings["high_quality"],
+                cleanup=settings["cleanup"],
+            )
+        timings["grid"] = time.perf_counter() - t0
+        result["size"] = list(size)
+
+        base = os.path.splitext(os.path.basename(image_path))[0]
+        base_root = os.path.join(out_dir, base)
+        outputs = settings["outputs"]
+        written = nd.export_pattern(
+            pattern,
+            base_root,
+            cell_px=settings["cell_px"],
+            include_dmc=settings["include_dmc"],
+            allow_specialty=not settings["regular_only"],
+            distance=settings["distance"],
+            export_legend="legend" in outputs,
+            export_workbook="workbook" in outputs,
+            export_color="color" in outputs,
+            export_symbols="symbols" in outputs,
+            tiled=settings["tiled"],
+            backend=settings["backend"],
+            legend_stats=settings["legend_stats"],
+            strands=settings["strands"],
+            timings=timings,
+            **stored,
+        )
+        result["outputs"].update(written)
+
+        if "project" in outputs and not image_path.lower().endswith(nd.PROJECT_EXT):
+            t0 = time.perf_counter()
+            project_path = base_root + nd.PROJECT_EXT
+            params = {k: settings[k] for k in DEFAULT_SETTINGS if k != "outputs"}
+            params["img_path"] = os.path.abspath(image_path)
+            params["match_mode"] = settings["distance"]  # the GUI's name for it
+            nd.save_project(
+                project_path,
+                pattern,
+                params,
+                allow_specialty=not settings["regular_only"],
+                distance=settings["distance"],
+            )
+            timings["project"] = time.perf_counter() - t0
+            result["outputs"]["project"] = project_path
+
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+        result["traceback"] = traceback.format_exc()
+
+    timings["total"] = time.perf_counter() - t_start
+    return result
+
+
+def output_clashes(jobs):
+    """
+    Groups of job images that would write the same out_dir/<name>_* files
+    (same file name minus extension, compared case-insensitively).
+    """
+    by_name = {}
+    for image, _ in jobs:
+        name = os.path.splitext(os.path.basename(image))[0].lower()
+        by_name.setdefault(name, []).append(image)
+    return [images for images in by_name.values() if len(images) > 1]
+
+
+def run_batch(
+    jobs, out_dir, workers=None, palette_path="dmc_palette_full.csv", on_result=None, stats_log=None
+):
+    """
+    Run (image_path, settings) jobs across a process pool.
+
+    on_result(result) is called in the parent as each image finishes.
+    stats_log collects every stage event (see nd.STATS) as JSON lines.
+    Returns the result dicts in job order. Raises ValueError, before
+    running anything, if two images would overwrite each other's outputs.
+    """
+    clashes = output_clashes(jobs)
+    if clashes:
+        raise ValueError(
+            "images would overwrite each other's outputs: "
+            + "; ".join(", ".join(images) for images in clashes)
+        )
+    os.makedirs(out_dir, exist_ok=True)
+    if not nd.DMC_PALETTE:
+        for message in nd.load_dmc_palette(palette_path):
+            print(f"Warning: DMC palette: {message}", file=sys.stderr)
+    if stats_log:
+        nd.STATS.set_log(stats_log)
+
+    results = [None] * len(jobs)
+    if workers == 1:
+        for i, (image, settings) in enumerate(jobs):
+            results[i] = run_job(image, settings, out_dir)
+            if on_result:
+                on_result(results[i])
+        return results
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(palette_path, stats_log),
+    ) as pool:
+        futures = {
+            pool.submit(run_job, image, settings, out_dir): i
+            for i, (image, settings) in enumerate(jobs)
+        }
+        for fut in as_completed(futures):
+            i = futures[fut]
+            try:
+                results[i] = fut.result()
+            except Exception as e:
+                # Worker process died (e.g. out of memory)
+                results[i] = {
+                    "image": jobs[i][0],
+                    "status": "error",
+                    "error": f"{type(e).__name__}: {e}",
+                    "timings": {},
+                    "outputs": {},
+                }
+            if on_result:
+                on_result(results[i])
+    return results
+
+
+# ============================================================
+#  COMMAND LINE
+# ============================================================
+
+def _print_result(result):
+    name = os.path.basename(result["image"])
+    if result["status"] == "ok":
+        stages = " ".join(
+            f"{k}={v:.2f}s" for k, v in result["timings"].items() if k != "total"
+        )
+        print(f"[ok]    {name}  {result['timings']['total']:.2f}s  ({stages})", flush=True)
+    else:
+        print(f"[error] {name}  {result['error']}", flush=True)
+
+
+def build_parser():
+    p = argparse.ArgumentParser(
+        description="Generate needlepoint patterns from images without the GUI."
+    )
+    p.add_argument("inputs", nargs="*", help="image files or folders of images")
+    p.add_argument("--manifest", help="JSON-lines manifest of images + settings")
+    p.add_argument("--out", default="patterns", help="output folder (default: patterns)")
+    p.add_argument("--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    p.add_argument("--palette", default="dmc_palette_full.csv", help="DMC palette CSV")
+    p.add_argument("--grid-max", type=int, default=DEFAULT_SETTINGS["grid_max"])
+    p.add_argument("--colors", type=int, default=DEFAULT_SETTINGS["color_count"])
+    p.add_argument("--cell-px", type=int, default=DEFAULT_SETTINGS["cell_px"])
+    p.add_argument("--no-keep-aspect", action="store_true")
+    p.add_argument("--no-dmc", action="store_true", help="leave DMC columns blank")
+    p.add_argument("--regular-only", action="store_true", help="match regular cotton only")
+    p.add_argument("--distance", choices=nd.DISTANCE_MODES, default="rgb")
+    p.add_argument(
+        "--quantizer",
+        choices=nd.QUANTIZERS,
+        default="adaptive",
+        help="pick chart colors adaptively or straight from the DMC palette",
+    )
+    p.add_argument(
+        "--dither",
+        choices=nd.DITHER_MODES,
+        default="none",
+        help="dithering for --quantizer dmc",
+    )
+    p.add_argument(
+        "--high-quality",
+        action="store_true",
+        help="decode sources at full resolution (slower; for small images)",
+    )
+    p.add_argument(
+        "--cleanup",
+        type=float,
+        default=0.0,
+        help="confetti cleanup / smoothing strength, 0 (off) to 1",
+    )
+    p.add_argument("--tiled", action="store_true", help="multi-page tiled chart PDFs")
+    p.add_argument(
+        "--backend",
+        choices=nd.PDF_BACKENDS,
+        default="raster",
+        help="single-page chart PDFs as 300 dpi rasters or vector shapes",
+    )
+    p.add_argument(
+        "--strands",
+        type=int,
+        default=nd.SKEIN_STRANDS,
+        help="floss strands per needle for the legend's skein estimate (default: 6)",
+    )
+    p.add_argument(
+        "--no-legend-stats",
+        action="store_true",
+        help="legend CSV with the original nine columns only",
+    )
+    p.add_argument(
+        "--outputs",
+        default=",".join(DEFAULT_SETTINGS["outputs"]),
+        help="comma-separated subset of: " + ", ".join(OUTPUTS),
+    )
+    p.add_argument("--report", help="write per-image results as JSON to this file")
+    p.add_argument("--palette-workbook", help="also write the DMC palette as a colored .xlsx here")
+    p.add_argument("--stats-log", help="append per-stage timing/memory events (JSON lines) here")
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    outputs = [o.strip() for o in args.outputs.split(",") if o.strip()]
+    defaults = {
+        "grid_max": args.grid_max,
+        "color_count": args.colors,
+        "cell_px": args.cell_px,
+        "keep_aspect": not args.no_keep_aspect,
+        "include_dmc": not args.no_dmc,
+        "regular_only": args.regular_only,
+        "distance": args.distance,
+        "quantizer": args.quantizer,
+        "dither": args.dither,
+        "high_quality": args.high_quality,
+        "cleanup": args.cleanup,
+        "outputs": outputs,
+        "tiled": args.tiled,
+        "backend": args.backend,
+        "strands": args.strands,
+        "legend_stats": not args.no_legend_stats,
+    }
+    try:
+        for name, value in defaults.items():
+            check_setting(name, value)
+    except ValueError as e:
+        print(f"Bad option: {e}", file=sys.stderr)
+        return 2
+
+    if args.palette_workbook:
+        if not nd.DMC_PALETTE:
+            nd.load_dmc_palette(args.palette)
+        nd.write_palette_xlsx(args.palette_workbook)
+        print(f"Wrote {args.palette_workbook} ({len(nd.DMC_PALETTE)} threads)")
+
+    jobs = []
+    try:
+        if args.manifest:
+            jobs.extend(read_manifest(args.manifest, defaults))
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    for path in args.inputs:
+        jobs.extend((image, dict(defaults)) for image in find_images(path))
+    if not jobs:
+        if args.palette_workbook:
+            return 0
+        print("No images given.", file=sys.stderr)
+        return 2
+    clashes = output_clashes(jobs)
+    if clashes:
+        for images in clashes:
+            print(f"Same output name: {', '.join(images)}", file=sys.stderr)
+        print("Rename the images or run them in separate batches (or --out folders).", file=sys.stderr)
+        return 2
+
+    t0 = time.perf_counter()
+    results = run_batch(
+        jobs,
+        args.out,
+        workers=args.jobs,
+        palette_path=args.palette,
+        on_result=_print_result,
+        stats_log=args.stats_log,
+    )
+    failed = sum(r["status"] != "ok" for r in results)
+    print(
+        f"{len(results) - failed}/{len(results)} images done in "
+        f"{time.perf_counter() - t0:.2f}s, {failed} failed"
+    )
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+"""
+Headless benchmarks for the pattern pipeline.
+
+    python3 needlepoint_bench.py --quick
+    python3 needlepoint_bench.py --images photos/ --out bench.json
+    python3 needlepoint_bench.py --baseline bench_base.json     # fail on regressions
+    python3 needlepoint_bench.py --quick --save-baseline bench_base.json
+
+Every case (image x grid size x color count x cell_px) times these stages:
+
+    quantize        quantize_image() down to the grid
+    cleanup         clean_pattern() at strength 0.5 on that grid
+    nearest_dmc     nearest_dmc() for every chart color, one call each
+    match_dmc       the same colors matched in one legend_dmc_rows() batch
+    render_color    render_pattern_image() color chart
+    render_symbols  render_pattern_image() symbol chart
+    export_pdf      export_single_page_pdf() of the color chart
+    page_preview    build_page_preview_image() of the color chart
+
+Each stage reports its best wall time over --repeat runs, the peak RSS
+while it ran, and the peak bytes / block count traced by tracemalloc
+(a separate run, so tracing doesn't skew the timings). Charts larger
+than --max-chart-mpix megapixels are skipped for the render stages.
+
+Results are written as JSON. Given --baseline, each stage is compared to
+the matching baseline entry and the run exits 1 if any got slower (or
+allocated more) than the tolerance allows.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+import needlepoint_designer_plus as nd
+
+
+STAGES = (
+    "quantize",
+    "cleanup",
+    "nearest_dmc",
+    "match_dmc",
+    "render_color",
+    "render_symbols",
+    "export_pdf",
+    "page_preview",
+)
+
+# Stages that render a full chart (skipped past --max-chart-mpix)
+CHART_STAGES = ("render_color", "render_symbols", "export_pdf", "page_preview")
+
+FULL_MATRIX = {
+    "grids": [50, 100, 200, 400, 1000],
+    "colors": [8, 40, 200],
+    "cells": [4, 10, 18],
+}
+QUICK_MATRIX = {
+    "grids": [50, 200],
+    "colors": [8, 40],
+    "cells": [10],
+}
+
+SYNTHETIC = ("gradient", "noise", "blocks")
+
+
+# ============================================================
+#  INPUTS
+# ============================================================
+
+def synthetic_image(kind, size=1200, seed=0):
+    """
+    Deterministic test images:
+      gradient  smooth color ramps (few distinct colors after quantizing)
+      noise     uniform RGB noise (every quantizer's worst case)
+      blocks    flat random rectangles, like clip art or a logo
+    """
+    rng = np.random.default_rng(seed)
+    if kind == "gradient":
+        y, x = np.mgrid[0:size, 0:size]
+        arr = np.stack(
+            [x * 255 // size, y * 255 // size, (x + y) * 127 // size],
+            axis=-1,
+        )
+    elif kind == "noise":
+        arr = rng.integers(0, 256, (size, size, 3))
+    elif kind == "blocks":
+        arr = np.full((size, size, 3), 255)
+        for _ in range(300):
+            x0, y0 = rng.integers(0, size, 2)
+            w, h = rng.integers(size // 40, size // 4, 2)
+            arr[y0:y0 + h, x0:x0 + w] = rng.integers(0, 256, 3)
+    else:
+        raise ValueError(f"Unknown synthetic image: {kind!r}")
+    return Image.fromarray(arr.astype(np.uint8), "RGB")
+
+
+def load_inputs(paths, synthetic=SYNTHETIC):
+    """
+    (name, RGB image) for each synthetic kind and each image file given.
+    """
+    inputs = [(f"synthetic:{kind}", synthetic_image(kind)) for kind in synthetic]
+    for path in paths:
+        if os.path.isdir(path):
+            files = [
+                os.path.join(path, n)
+                for n in sorted(os.listdir(path))
+                if n.lower().endswith((".png", ".jpg", ".jpeg", ".webp", ".bmp"))
+            ]
+        else:
+            files = [path]
+        for f in files:
+            with Image.open(f) as img:
+                inputs.append((os.path.basename(f), img.convert("RGB")))
+    return inputs
+
+
+# ============================================================
+#  MEASUREMENT
+# ============================================================
+
+def _reset_peak_rss():
+    """
+    Reset the kernel's peak-RSS counter (Linux); returns False elsewhere.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def measure(fn, repeat=3):
+    """
+    Run fn() repeat times (best wall time), then once under tracemalloc.
+
+    Returns (result of the last run, stats dict).
+    """
+    best = float("inf")
+    _reset_peak_rss()
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    peak_rss = nd.peak_rss_mb() or 0.0
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, alloc_peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    finally:
+        tracemalloc.stop()
+
+    return result, {
+        "time_s": best,
+        "peak_rss_mb": round(peak_rss, 1),
+        "alloc_peak_mb": round(alloc_peak / (1024.0 * 1024.0), 3),
+        "alloc_blocks": blocks,
+    }
+
+
+# ============================================================
+#  BENCHMARK RUN
+# ============================================================
+
+def run_case(name, img, grid, colors, cells, stages, repeat, max_chart_mpix, tmp_dir):
+    """
+    Benchmark one (image, grid, colors) combination at every cell size.
+    Returns a list of result rows.
+    """
+    out_w, out_h = nd.grid_size(img.size, grid)
+    base = {"image": name, "grid": grid, "size": [out_w, out_h], "colors": colors}
+    rows = []
+
+    def record(stage, fn, **extra):
+        result, stats = measure(fn, repeat)
+        row = dict(base, stage=stage, **extra)
+        row.update(stats)
+        rows.append(row)
+        return result
+
+    pattern = nd.Pattern.from_image(nd.quantize_image(img, out_w, out_h, colors))
+    if "quantize" in stages:
+        record("quantize", lambda: nd.quantize_image(img, out_w, out_h, colors))
+    if "cleanup" in stages:
+        record("cleanup", lambda: nd.clean_pattern(pattern, 0.5))
+
+    order, symbol_of, _ = nd.build_palette_map(pattern)
+    chart_colors = [pattern.color(i) for i in order]
+    if "nearest_dmc" in stages:
+        record("nearest_dmc", lambda: [nd.nearest_dmc(c) for c in chart_colors])
+    if "match_dmc" in stages:
+        record("match_dmc", lambda: nd.legend_dmc_rows(pattern, order, cache=None))
+
+    for cell_px in cells:
+        if out_w * out_h * cell_px * cell_px > max_chart_mpix * 1e6:
+            continue
+        if "render_color" in stages:
+            big = record(
+                "render_color",
+                lambda: nd.render_pattern_image(pattern, cell_px, numbered=True),
+                cell_px=cell_px,
+            )
+        else:
+            big = nd.render_pattern_image(pattern, cell_px, numbered=True)
+        if "render_symbols" in stages:
+            record(
+                "render_symbols",
+                lambda: nd.render_pattern_image(
+                    pattern, cell_px, numbered=True, symbols=True, palette_map=symbol_of
+                ),
+                cell_px=cell_px,
+            )
+        if "export_pdf" in stages:
+            pdf_path = os.path.join(tmp_dir, "bench.pdf")
+            record(
+                "export_pdf",
+                lambda: nd.export_single_page_pdf(big, pdf_path),
+                cell_px=cell_px,
+            )
+        if "page_preview" in stages:
+            record(
+                "page_preview",
+                lambda: nd.build_page_preview_image(big),
+                cell_px=cell_px,
+            )
+        del big
+    return rows
+
+
+def row_key(row):
+    """
+    Identity of a result row, for matching against a baseline.
+    """
+    return (row["image"], row["stage"], row["grid"], row["colors"], row.get("cell_px"))
+
+
+def compare(results, baseline, tolerance=0.25, min_time=0.005, alloc_tolerance=0.25):
+    """
+    Regressions of results against baseline rows, as printable strings.
+
+    A stage regresses when its time exceeds the baseline by more than
+    tolerance (as a fraction) and by more than min_time seconds, or its
+    traced allocation peak grows by more than alloc_tolerance.
+    """
+    base = {row_key(r): r for r in baseline}
+    problems = []
+    for row in results:
+        ref = base.get(row_key(row))
+        if ref is None:
+            continue
+        label = "{image} {stage} grid={grid} colors={colors}".format(**row)
+        if row.get("cell_px"):
+            label += f" cell={row['cell_px']}"
+
+        t, t_ref = row["time_s"], ref["time_s"]
+        if t > t_ref * (1 + tolerance) and t - t_ref > min_time:
+            problems.append(f"{label}: {t_ref:.4f}s -> {t:.4f}s ({t / t_ref:.2f}x)")
+
+        a, a_ref = row["alloc_peak_mb"], ref["alloc_peak_mb"]
+        if a > a_ref * (1 + alloc_tolerance) and a - a_ref > 1.0:
+            problems.append(f"{label}: allocations {a_ref:.1f} MB -> {a:.1f} MB")
+    return problems
+
+
+def scaling(results):
+    """
+    Log-log slope of time against stitch count for each stage, over cases
+    that differ only in grid size: ~1.0 means linear in stitches.
+    """
+    series = {}
+    for row in results:
+        key = (row["stage"], row["image"], row["colors"], row.get("cell_px"))
+        series.setdefault(key, []).append((row["size"][0] * row["size"][1], row["time_s"]))
+
+    slopes = {}
+    for (stage, *_), points in series.items():
+        points = [(n, t) for n, t in points if t > 0]
+        if len(points) < 2:
+            continue
+        n, t = np.log([p[0] for p in points]), np.log([p[1] for p in points])
+        if np.ptp(n) == 0:
+            continue
+        slopes.setdefault(stage, []).append(float(np.polyfit(n, t, 1)[0]))
+    return {stage: round(float(np.median(v)), 2) for stage, v in slopes.items()}
+
+
+# ============================================================
+#  COMMAND LINE
+# ============================================================
+
+def _int_list(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+
+def build_parser():
+    p = argparse.ArgumentParser(description="Benchmark the needlepoint pattern pipeline.")
+    p.add_argument("--images", nargs="*", default=[], help="real image files or folders to add")
+    p.add_argument("--no-synthetic", action="store_true", help="skip the generated test images")
+    p.add_argument("--quick", action="store_true", help="small matrix for a fast check")
+    p.add_argument("--grids", type=_int_list, help="comma-separated grid sizes (long side)")
+    p.add_argument("--colors", type=_int_list, help="comma-separated color counts")
+    p.add_argument("--cells", type=_int_list, help="comma-separated cell_px values")
+    p.add_argument(
+        "--stages",
+        default=",".join(STAGES),
+        help="comma-separated subset of: " + ", ".join(STAGES),
+    )
+    p.add_argument("--repeat", type=int, default=3, help="timed runs per stage (best is kept)")
+    p.add_argument("--max-chart-mpix", type=float, default=80.0, help="skip larger chart renders")
+    p.add_argument("--palette", default="dmc_palette_full.csv", help="DMC palette CSV")
+    p.add_argument("--out", default="bench_results.json", help="where to write results")
+    p.add_argument("--baseline", help="compare against this results file")
+    p.add_argument("--save-baseline", help="also write the results here as the new baseline")
+    p.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown (fraction)")
+    p.add_argument("--min-time", type=float, default=0.005, help="ignore slowdowns under this (s)")
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    bad = set(stages) - set(STAGES)
+    if bad:
+        print(f"Unknown stages: {', '.join(sorted(bad))}", file=sys.stderr)
+        return 2
+
+    matrix = dict(QUICK_MATRIX if args.quick else FULL_MATRIX)
+    for key in ("grids", "colors", "cells"):
+        if getattr(args, key):
+            matrix[key] = getattr(args, key)
+
+    for message in nd.load_dmc_palette(args.palette):
+        print(f"Warning: DMC palette: {message}", file=sys.stderr)
+    if not nd.DMC_PALETTE:
+        print(f"Warning: no DMC palette loaded from {args.palette}", file=sys.stderr)
+    inputs = load_inputs(args.images, () if args.no_synthetic else SYNTHETIC)
+    if not inputs:
+        print("No images to benchmark.", file=sys.stderr)
+        return 2
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, img in inputs:
+            for grid in matrix["grids"]:
+                for colors in matrix["colors"]:
+                    rows = run_case(
+                        name,
+                        img,
+                        grid,
+                        colors,
+                        matrix["cells"],
+                        stages,
+                        args.repeat,
+                        args.max_chart_mpix,
+                        tmp_dir,
+                    )
+                    for row in rows:
+                        cell = f" cell={row['cell_px']}" if row.get("cell_px") else ""
+                        print(
+                            f"{name:<22} {row['stage']:<15} grid={grid:<5} colors={colors:<4}{cell:<9}"
+                            f" {row['time_s'] * 1000:9.1f} ms  rss {row['peak_rss_mb']:7.1f} MB"
+                            f"  alloc {row['alloc_peak_mb']:8.2f} MB",
+                            flush=True,
+                        )
+                    results.extend(rows)
+
+    slopes = scaling(results)
+    if slopes:
+        print("\nScaling exponent (time ~ stitches^k):")
+        for stage in STAGES:
+            if stage in slopes:
+                print(f"  {stage:<15} k = {slopes[stage]}")
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pillow": Image.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "matrix": matrix,
+            "repeat": args.repeat,
+        },
+        "scaling": slopes,
+        "results": results,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        problems = compare(results, baseline, args.tolerance, args.min_time)
+        if problems:
+            print(f"\n{len(problems)} regression(s) against {args.baseline}:")
+            for line in problems:
+                print("  " + line)
+            return 1
+        print(f"\nNo regressions against {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
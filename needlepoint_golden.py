@@ -0,0 +1,546 @@
+"""
+Golden-output equivalence harness for the render and match paths.
+
+    python3 needlepoint_golden.py capture --reference-rev cdea9c5 --out golden/
+    python3 needlepoint_golden.py check --fixtures golden/
+    python3 needlepoint_golden.py check --stages chart,page --report golden_report.json
+
+capture runs a reference implementation (the working tree, or the
+needlepoint_designer_plus.py of any git revision) through its plain,
+unoptimized API over a corpus of synthetic images and demo_images/, and
+saves what it produced as fixtures:
+
+    grid    quantize_image() to the stitch grid           (.npy, exact)
+    dmc     nearest_dmc() per color, all / regular only   (.json, exact)
+    legend  the legend CSV's original nine columns        (.csv, exact)
+    chart   render_pattern_image() color + symbol charts  (.png, exact)
+    page    build_page_preview_image() composite          (.png, exact)
+    pdf     page image inside export_single_page_pdf()    (.png, tolerance)
+
+check feeds the same inputs through the current optimized paths
+(quantize_pattern, match_dmc, write_legend_csv, Pattern rendering, ...)
+and compares each output with its fixture. Every stage starts from the
+fixture inputs (a chart is rendered from the golden grid, a page from the
+golden chart), so a mismatch points at one stage. The best-of-N time of
+both sides is printed next to each result. Exits 1 if anything differs.
+"""
+
+import io
+import os
+import re
+import sys
+import csv
+import json
+import time
+import zlib
+import argparse
+import platform
+import tempfile
+import subprocess
+import importlib.util
+from collections import Counter
+
+import numpy as np
+from PIL import Image
+
+import needlepoint_designer_plus as nd
+from needlepoint_bench import synthetic_image, load_inputs
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+STAGES = ("grid", "dmc", "legend", "chart", "page", "pdf")
+
+# Allowed difference per stage: largest per-channel difference and mean
+# absolute difference over all pixels. The PDF page is stored as JPEG, so
+# an encoder change may move a few values.
+TOLERANCES = {
+    "chart": {"max_diff": 0, "mean_diff": 0.0},
+    "page": {"max_diff": 0, "mean_diff": 0.0},
+    "pdf": {"max_diff": 24, "mean_diff": 0.5},
+}
+
+# (name, grid width, grid height, color count) per synthetic source; demo
+# images get DEMO_GRID stitches on the long side and DEMO_COLORS colors
+SYNTHETIC_CORPUS = (
+    ("gradient", 72, 48, 16),
+    ("noise", 40, 40, 48),
+    ("blocks", 60, 45, 8),
+)
+SYNTHETIC_SIZE = 360
+DEMO_GRID = 80
+DEMO_COLORS = 32
+SOURCE_MAX = 480  # stored sources are scaled down to this long side
+
+CELL_SIZES = (18, 7)
+DMC_SAMPLES = 256  # random colors matched on top of each grid's own colors
+
+MANIFEST = "manifest.json"
+LEGEND_HEADER = ("symbol", "r", "g", "b", "hex", "dmc_code", "dmc_name", "dmc_type", "stitches")
+
+
+# ============================================================
+#  REFERENCE MODULE + CORPUS
+# ============================================================
+
+def load_reference(rev=None):
+    """
+    needlepoint_designer_plus as of git revision rev (the working tree if
+    None), imported as a separate module so it has its own globals.
+    """
+    path = os.path.join(HERE, "needlepoint_designer_plus.py")
+    if rev:
+        source = subprocess.check_output(
+            ["git", "show", f"{rev}:needlepoint_designer_plus.py"], cwd=HERE
+        )
+        tmp_dir = tempfile.mkdtemp(prefix="golden_ref_")
+        path = os.path.join(tmp_dir, "needlepoint_designer_plus.py")
+        with open(path, "wb") as f:
+            f.write(source)
+    spec = importlib.util.spec_from_file_location("golden_reference", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_corpus(image_paths):
+    """
+    (name, RGB source, grid width, grid height, colors) for each synthetic
+    image and each image file (or folder of images) given.
+    """
+    corpus = [
+        (kind, synthetic_image(kind, size=SYNTHETIC_SIZE), w, h, colors)
+        for kind, w, h, colors in SYNTHETIC_CORPUS
+    ]
+    for name, img in load_inputs(image_paths, synthetic=()):
+        scale = min(1.0, SOURCE_MAX / max(img.size))
+        if scale < 1.0:
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+        w, h = nd.grid_size(img.size, DEMO_GRID)
+        corpus.append((os.path.splitext(name)[0], img, w, h, DEMO_COLORS))
+    return corpus
+
+
+def dmc_inputs(grid, seed=0):
+    """
+    Colors to match: the grid's own colors (first seen order) plus
+    DMC_SAMPLES random ones, as a list of [r, g, b].
+    """
+    flat = grid.reshape(-1, 3)
+    _, first = np.unique(flat, axis=0, return_index=True)
+    own = flat[np.sort(first)]
+    extra = np.random.default_rng(seed).integers(0, 256, (DMC_SAMPLES, 3))
+    return np.concatenate([own, extra]).astype(int).tolist()
+
+
+# ============================================================
+#  STAGES (reference = plain API, candidate = optimized paths)
+# ============================================================
+
+def _legacy_grid(grid):
+    return [[tuple(px) for px in row] for row in grid.tolist()]
+
+
+def _legend_order(grid):
+    """
+    Colors by stitch count, ties in first-seen order (the original legend).
+    """
+    counts = Counter(tuple(px) for px in grid.reshape(-1, 3).tolist())
+    return counts.most_common()
+
+
+def ref_grid(ref, src, w, h, colors):
+    return np.asarray(ref.quantize_image(src, w, h, colors).convert("RGB"), dtype=np.uint8)
+
+
+def cand_grid(src, w, h, colors):
+    return nd.quantize_pattern(src, w, h, colors).to_rgb_array()
+
+
+def ref_dmc(ref, colors, allow_specialty):
+    return [list(ref.nearest_dmc(tuple(c), allow_specialty=allow_specialty)) for c in colors]
+
+
+def cand_dmc(colors, allow_specialty):
+    rows = nd.match_dmc(np.asarray(colors), allow_specialty=allow_specialty)
+    return [list(nd.dmc_info(int(row))) for row in rows]
+
+
+def ref_legend(ref, grid):
+    rows = []
+    for i, (col, count) in enumerate(_legend_order(grid)):
+        code, name, kind = ref.nearest_dmc(col) if ref.DMC_PALETTE else ("", "", "")
+        rows.append([ref.SYMBOLS[i % len(ref.SYMBOLS)], *col, ref.rgb_to_hex(col), code, name, kind, count])
+    return [[str(v) for v in row] for row in rows]
+
+
+def cand_legend(pattern, tmp_dir):
+    path = os.path.join(tmp_dir, "legend.csv")
+    stats = nd.stitch_stats(pattern)
+    order, symbol_of, counts = nd.build_palette_map(pattern, stats["counts"])
+    dmc_rows = nd.legend_dmc_rows(pattern, order, cache=None)
+    nd.write_legend_csv(path, pattern, order, symbol_of, counts, dmc_rows, stats)
+    with open(path, newline="", encoding="utf-8") as f:
+        table = list(csv.reader(f))
+    columns = [table[0].index(name) for name in LEGEND_HEADER]
+    return [[row[c] for c in columns] for row in table[1:]]
+
+
+def ref_chart(ref, grid, cell_px, symbols):
+    palette_map = None
+    if symbols:
+        palette_map = {
+            col: ref.SYMBOLS[i % len(ref.SYMBOLS)] for i, (col, _) in enumerate(_legend_order(grid))
+        }
+    return ref.render_pattern_image(_legacy_grid(grid), cell_px, numbered=True, symbols=symbols, palette_map=palette_map)
+
+
+def cand_chart(pattern, symbol_of, cell_px, symbols):
+    return nd.render_pattern_image(
+        pattern, cell_px, numbered=True, symbols=symbols, palette_map=symbol_of if symbols else None
+    )
+
+
+def pdf_page_image(path):
+    """
+    The page image embedded in a single-image PDF (JPEG or Flate RGB).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    for match in re.finditer(rb"<<(.*?)>>\s*stream\r?\n", data, re.S):
+        head = match.group(1)
+        if b"/Image" not in head:
+            continue
+        length = int(re.search(rb"/Length\s+(\d+)", head).group(1))
+        stream = data[match.end():match.end() + length]
+        if b"/DCTDecode" in head:
+            return Image.open(io.BytesIO(stream)).convert("RGB")
+        w = int(re.search(rb"/Width\s+(\d+)", head).group(1))
+        h = int(re.search(rb"/Height\s+(\d+)", head).group(1))
+        return Image.frombytes("RGB", (w, h), zlib.decompress(stream))
+    raise ValueError(f"no page image in {path}")
+
+
+def export_page(module, chart, tmp_dir):
+    path = os.path.join(tmp_dir, "page.pdf")
+    module.export_single_page_pdf(chart, path, margin_inches=0.5, dpi=300)
+    return path
+
+
+# ============================================================
+#  TIMING + COMPARISON
+# ============================================================
+
+def timed(fn, repeat):
+    """
+    (result of the last run, best wall time in ms over repeat runs).
+    """
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return result, best * 1000.0
+
+
+def compare_images(expected, actual, tolerance):
+    """
+    (ok, detail) for two images or RGB arrays under a TOLERANCES entry.
+    """
+    a = np.asarray(expected, dtype=np.int16)
+    b = np.asarray(actual, dtype=np.int16)
+    if a.shape != b.shape:
+        return False, f"shape {b.shape[:2][::-1]} != {a.shape[:2][::-1]}"
+    diff = np.abs(a - b)
+    max_diff = int(diff.max()) if diff.size else 0
+    if max_diff == 0:
+        return True, "exact"
+    mean_diff = float(diff.mean())
+    changed = int(np.count_nonzero(np.any(diff, axis=-1) if diff.ndim == 3 else diff))
+    detail = f"max {max_diff}, mean {mean_diff:.3f}, {changed} px differ"
+    ok = max_diff <= tolerance["max_diff"] and mean_diff <= tolerance["mean_diff"]
+    return ok, detail
+
+
+def compare_rows(expected, actual):
+    """
+    (ok, detail) for two tables (lists of rows), reporting the first
+    differing row.
+    """
+    if expected == actual:
+        return True, "exact"
+    if len(expected) != len(actual):
+        return False, f"{len(actual)} rows != {len(expected)}"
+    for i, (want, got) in enumerate(zip(expected, actual)):
+        if want != got:
+            return False, f"row {i}: {got} != {want}"
+    return False, "differs"
+
+
+# ============================================================
+#  CAPTURE
+# ============================================================
+
+def capture(ref, corpus, out_dir, repeat, palette_path, reference="working tree"):
+    """
+    Run the reference over the corpus and write fixtures + manifest;
+    reference names it in the manifest.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    if palette_path:
+        ref.load_dmc_palette(palette_path)
+    cases = []
+
+    def record(source, stage, variant, ms, filename, **extra):
+        case = {"id": f"{source}/{stage}{'/' + variant if variant else ''}", "source": source,
+                "stage": stage, "variant": variant, "file": filename, "ref_ms": round(ms, 2)}
+        case.update(extra)
+        cases.append(case)
+        print(f"  {case['id']:<36} {ms:9.1f} ms", flush=True)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, src, w, h, colors in corpus:
+            print(f"{name} ({w}x{h}, {colors} colors)")
+            src_file = f"{name}_source.png"
+            src.save(os.path.join(out_dir, src_file))
+
+            grid, ms = timed(lambda: ref_grid(ref, src, w, h, colors), repeat)
+            np.save(os.path.join(out_dir, f"{name}_grid.npy"), grid)
+            record(name, "grid", "", ms, f"{name}_grid.npy", source_file=src_file, size=[w, h], colors=colors)
+
+            inputs = dmc_inputs(grid)
+            for variant, allow in (("all", True), ("regular", False)):
+                threads, ms = timed(lambda: ref_dmc(ref, inputs, allow), repeat)
+                filename = f"{name}_dmc_{variant}.json"
+                with open(os.path.join(out_dir, filename), "w", encoding="utf-8") as f:
+                    json.dump({"colors": inputs, "allow_specialty": allow, "threads": threads}, f)
+                record(name, "dmc", variant, ms, filename)
+
+            rows, ms = timed(lambda: ref_legend(ref, grid), repeat)
+            filename = f"{name}_legend.csv"
+            with open(os.path.join(out_dir, filename), "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(LEGEND_HEADER)
+                writer.writerows(rows)
+            record(name, "legend", "", ms, filename)
+
+            for cell_px in CELL_SIZES:
+                for mode in ("color", "symbols"):
+                    chart, ms = timed(lambda: ref_chart(ref, grid, cell_px, mode == "symbols"), repeat)
+                    filename = f"{name}_chart_{mode}_{cell_px}.png"
+                    chart.save(os.path.join(out_dir, filename))
+                    record(name, "chart", f"{mode}/{cell_px}", ms, filename, cell_px=cell_px)
+                    if mode != "color":
+                        continue
+
+                    page, ms = timed(lambda: ref.build_page_preview_image(chart), repeat)
+                    filename = f"{name}_page_{cell_px}.png"
+                    page.save(os.path.join(out_dir, filename))
+                    record(name, "page", str(cell_px), ms, filename, chart_file=f"{name}_chart_color_{cell_px}.png")
+
+                    path, ms = timed(lambda: export_page(ref, chart, tmp_dir), repeat)
+                    filename = f"{name}_pdf_{cell_px}.png"
+                    pdf_page_image(path).save(os.path.join(out_dir, filename))
+                    record(name, "pdf", str(cell_px), ms, filename, chart_file=f"{name}_chart_color_{cell_px}.png")
+
+    manifest = {
+        "meta": {
+            "reference": reference,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pillow": Image.__version__,
+            "palette": os.path.basename(palette_path) if palette_path else "",
+            "repeat": repeat,
+        },
+        "cases": cases,
+    }
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# ============================================================
+#  CHECK
+# ============================================================
+
+def check(fixtures, stages, repeat, palette_path):
+    """
+    Run the candidate paths against every fixture in stages. Returns the
+    manifest meta and one result dict per case.
+    """
+    with open(os.path.join(fixtures, MANIFEST), encoding="utf-8") as f:
+        manifest = json.load(f)
+    meta = manifest["meta"]
+    if meta.get("pillow") != Image.__version__:
+        print(
+            f"Warning: fixtures captured with Pillow {meta.get('pillow')}, running {Image.__version__}",
+            file=sys.stderr,
+        )
+    if palette_path and not nd.DMC_PALETTE:
+        nd.load_dmc_palette(palette_path)
+
+    def fixture(filename):
+        return os.path.join(fixtures, filename)
+
+    patterns = {}
+
+    def golden_pattern(source):
+        # Pattern + legend symbols of the golden grid, built once per source
+        if source not in patterns:
+            pattern = nd.Pattern.from_rgb_array(np.load(fixture(f"{source}_grid.npy")))
+            _, symbol_of, _ = nd.build_palette_map(pattern)
+            patterns[source] = (pattern, symbol_of)
+        return patterns[source]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for case in manifest["cases"]:
+            stage = case["stage"]
+            if stage not in stages:
+                continue
+            source = case["source"]
+            try:
+                if stage == "grid":
+                    with Image.open(fixture(case["source_file"])) as img:
+                        src = img.convert("RGB")
+                    w, h = case["size"]
+                    actual, ms = timed(lambda: cand_grid(src, w, h, case["colors"]), repeat)
+                    expected = np.load(fixture(case["file"]))
+                    ok, detail = compare_images(expected, actual, {"max_diff": 0, "mean_diff": 0.0})
+                elif stage == "dmc":
+                    with open(fixture(case["file"]), encoding="utf-8") as f:
+                        golden = json.load(f)
+                    actual, ms = timed(lambda: cand_dmc(golden["colors"], golden["allow_specialty"]), repeat)
+                    ok, detail = compare_rows(golden["threads"], actual)
+                elif stage == "legend":
+                    pattern, _ = golden_pattern(source)
+                    actual, ms = timed(lambda: cand_legend(pattern, tmp_dir), repeat)
+                    with open(fixture(case["file"]), newline="", encoding="utf-8") as f:
+                        expected = list(csv.reader(f))[1:]
+                    ok, detail = compare_rows(expected, actual)
+                elif stage == "chart":
+                    pattern, symbol_of = golden_pattern(source)
+                    symbols = case["variant"].startswith("symbols")
+                    actual, ms = timed(lambda: cand_chart(pattern, symbol_of, case["cell_px"], symbols), repeat)
+                    with Image.open(fixture(case["file"])) as expected:
+                        ok, detail = compare_images(expected.convert("RGB"), actual.convert("RGB"), TOLERANCES["chart"])
+                else:
+                    with Image.open(fixture(case["chart_file"])) as img:
+                        chart = img.convert("RGB")
+                    if stage == "page":
+                        actual, ms = timed(lambda: nd.build_page_preview_image(chart), repeat)
+                    else:
+                        path, ms = timed(lambda: export_page(nd, chart, tmp_dir), repeat)
+                        actual = pdf_page_image(path)
+                    with Image.open(fixture(case["file"])) as expected:
+                        ok, detail = compare_images(expected.convert("RGB"), actual.convert("RGB"), TOLERANCES[stage])
+            except Exception as e:
+                ok, detail, ms = False, f"{type(e).__name__}: {e}", float("nan")
+
+            result = {
+                "id": case["id"],
+                "stage": stage,
+                "ok": ok,
+                "detail": detail,
+                "ref_ms": case["ref_ms"],
+                "new_ms": round(ms, 2),
+                "speedup": round(case["ref_ms"] / ms, 2) if ms > 0 else None,
+            }
+            results.append(result)
+            speedup = f"{result['speedup']:.2f}x" if result["speedup"] else "-"
+            print(
+                f"{'ok  ' if ok else 'FAIL'} {case['id']:<36} {case['ref_ms']:9.1f} ms {ms:9.1f} ms"
+                f" {speedup:>8}  {detail}",
+                flush=True,
+            )
+    return meta, results
+
+
+def summarize(results):
+    """
+    Per-stage totals: cases, failures, summed reference and new times.
+    """
+    summary = {}
+    for r in results:
+        s = summary.setdefault(r["stage"], {"cases": 0, "failed": 0, "ref_ms": 0.0, "new_ms": 0.0})
+        s["cases"] += 1
+        s["failed"] += not r["ok"]
+        s["ref_ms"] += r["ref_ms"]
+        s["new_ms"] += r["new_ms"] if r["new_ms"] == r["new_ms"] else 0.0
+    return summary
+
+
+# ============================================================
+#  COMMAND LINE
+# ============================================================
+
+def build_parser():
+    p = argparse.ArgumentParser(description="Capture and check golden pattern outputs.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    cap = sub.add_parser("capture", help="write fixtures from a reference implementation")
+    cap.add_argument("--reference-rev", help="git revision to use as the reference (default: working tree)")
+    cap.add_argument("--out", default="golden", help="fixture folder (default: golden)")
+    cap.add_argument(
+        "--images",
+        nargs="*",
+        default=[os.path.join(HERE, "demo_images")],
+        help="image files or folders added to the synthetic corpus (default: demo_images/)",
+    )
+
+    chk = sub.add_parser("check", help="compare the current code against fixtures")
+    chk.add_argument("--fixtures", default="golden", help="fixture folder (default: golden)")
+    chk.add_argument(
+        "--stages",
+        default=",".join(STAGES),
+        help="comma-separated subset of: " + ", ".join(STAGES),
+    )
+    chk.add_argument("--report", help="write per-case results as JSON to this file")
+
+    for sp in (cap, chk):
+        sp.add_argument("--repeat", type=int, default=3, help="timed runs per case (best is kept)")
+        sp.add_argument("--palette", default="dmc_palette_full.csv", help="DMC palette CSV")
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if args.command == "capture":
+        ref = load_reference(args.reference_rev)
+        reference = args.reference_rev or "working tree"
+        manifest = capture(ref, build_corpus(args.images), args.out, args.repeat, args.palette, reference)
+        print(f"{len(manifest['cases'])} fixtures written to {args.out}")
+        return 0
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    bad = set(stages) - set(STAGES)
+    if bad:
+        print(f"Unknown stages: {', '.join(sorted(bad))}", file=sys.stderr)
+        return 2
+
+    meta, results = check(args.fixtures, stages, args.repeat, args.palette)
+    summary = summarize(results)
+    print(f"\nAgainst {meta.get('reference')} (Pillow {meta.get('pillow')}):")
+    for stage in STAGES:
+        if stage in summary:
+            s = summary[stage]
+            speedup = s["ref_ms"] / s["new_ms"] if s["new_ms"] else 0.0
+            print(
+                f"  {stage:<7} {s['cases'] - s['failed']}/{s['cases']} equal"
+                f"  {s['ref_ms']:10.1f} ms -> {s['new_ms']:10.1f} ms  ({speedup:.2f}x)"
+            )
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "summary": summary, "results": results}, f, indent=2)
+
+    failed = sum(not r["ok"] for r in results)
+    if failed:
+        print(f"\n{failed} case(s) differ from the golden outputs.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Minimal streaming PDF writer.
+
+Objects are written to the file as soon as they're added, and only their
+byte offsets are kept, so a document of any length needs only one page's
+worth of memory. Used for the tiled multi-page export and the vector
+chart backend (standard fonts + one tiling pattern per symbol).
+
+    with PdfWriter("out.pdf") as pdf:
+        im = pdf.add_image(pil_image)
+        pdf.add_page(612, 792, b"q 612 0 0 792 0 0 cm /Im0 Do Q", xobjects={"Im0": im})
+"""
+
+import zlib
+
+
+class PdfWriter:
+    def __init__(self, path, compress_level=6):
+        self.path = path
+        self.compress_level = compress_level
+        self._f = open(path, "wb")
+        self._offsets = {}  # object number -> byte offset
+        self._next_num = 3  # 1 = catalog, 2 = page tree (written on close)
+        self._pages = []
+        self._f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    # ---------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._f.close()
+
+    # ---------------------------
+    def _new_num(self):
+        num = self._next_num
+        self._next_num += 1
+        return num
+
+    def _write_object(self, num, body, stream=None):
+        """
+        Write object `num`; body is the dictionary (or value) as bytes.
+        """
+        self._offsets[num] = self._f.tell()
+        self._f.write(b"%d 0 obj\n" % num)
+        self._f.write(body)
+        if stream is not None:
+            self._f.write(b"\nstream\n")
+            self._f.write(stream)
+            self._f.write(b"\nendstream")
+        self._f.write(b"\nendobj\n")
+
+    def add_object(self, body, stream=None):
+        """
+        Write a raw object and return its number.
+        """
+        num = self._new_num()
+        self._write_object(num, body, stream)
+        return num
+
+    # ---------------------------
+    def add_image(self, img):
+        """
+        Embed a Pillow image (converted to RGB) as a Flate-compressed
+        image XObject. Returns its object number.
+        """
+        img = img.convert("RGB")
+        data = zlib.compress(img.tobytes(), self.compress_level)
+        w, h = img.size
+        body = (
+            b"<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+            b"/ColorSpace /DeviceRGB /BitsPerComponent 8 "
+            b"/Filter /FlateDecode /Length %d >>" % (w, h, len(data))
+        )
+        return self.add_object(body, data)
+
+    def add_standard_font(self, base_font="Helvetica"):
+        """
+        Reference one of the 14 standard PDF fonts (nothing is embedded;
+        every viewer ships them). Text is WinAnsi (cp1252) encoded.
+        """
+        return self.add_object(
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /%s "
+            b"/Encoding /WinAnsiEncoding >>" % base_font.encode("ascii")
+        )
+
+    def add_tiling_pattern(self, content, matrix, fonts=None):
+        """
+        Add a colored tiling pattern whose cell is the unit square in
+        pattern space; matrix maps pattern space onto the page. Fill with
+        it via "/Pattern cs /Name scn". Returns its object number.
+        """
+        res = _resources(fonts=fonts)
+        return self.add_object(
+            b"<< /Type /Pattern /PatternType 1 /PaintType 1 /TilingType 1 "
+            b"/BBox [0 0 1 1] /XStep 1 /YStep 1 /Matrix [%s] "
+            b"/Resources << %s >> /Length %d >>"
+            % (b" ".join(_num(v) for v in matrix), res, len(content)),
+            content,
+        )
+
+    def add_page(self, width_pt, height_pt, content, xobjects=None, fonts=None, patterns=None):
+        """
+        Add a page with the given content stream (bytes, PDF operators).
+
+        xobjects / fonts / patterns map resource names to object numbers.
+        """
+        data = zlib.compress(content, self.compress_level)
+        content_num = self.add_object(
+            b"<< /Filter /FlateDecode /Length %d >>" % len(data), data
+        )
+
+        page_num = self._new_num()
+        self._write_object(
+            page_num,
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %s %s] "
+            b"/Resources << %s >> /Contents %d 0 R >>"
+            % (
+                _num(width_pt),
+                _num(height_pt),
+                _resources(xobjects, fonts, patterns),
+                content_num,
+            ),
+        )
+        self._pages.append(page_num)
+        return page_num
+
+    def add_image_page(self, img, width_pt, height_pt):
+        """
+        Add a page that is just `img` stretched over the full page.
+        """
+        im = self.add_image(img)
+        content = b"q %s 0 0 %s 0 0 cm /Im0 Do Q" % (_num(width_pt), _num(height_pt))
+        return self.add_page(width_pt, height_pt, content, xobjects={"Im0": im})
+
+    # ---------------------------
+    def close(self):
+        if self._f.closed:
+            return
+        kids = b" ".join(b"%d 0 R" % n for n in self._pages)
+        self._write_object(
+            2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self._pages))
+        )
+        self._write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+
+        xref_at = self._f.tell()
+        count = self._next_num
+        self._f.write(b"xref\n0 %d\n" % count)
+        self._f.write(b"0000000000 65535 f \n")
+        for num in range(1, count):
+            self._f.write(b"%010d 00000 n \n" % self._offsets[num])
+        self._f.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (count, xref_at)
+        )
+        self._f.close()
+
+
+def _resources(xobjects=None, fonts=None, patterns=None):
+    """
+    Body of a /Resources dictionary from name -> object number maps.
+    """
+    parts = []
+    for key, entries in (
+        (b"XObject", xobjects),
+        (b"Font", fonts),
+        (b"Pattern", patterns),
+    ):
+        if entries:
+            refs = b" ".join(
+                b"/%s %d 0 R" % (name.encode("ascii"), num)
+                for name, num in entries.items()
+            )
+            parts.append(b"/%s << %s >>" % (key, refs))
+    return b" ".join(parts)
+
+
+def pdf_text(text):
+    """
+    Encode text as a PDF string literal for a WinAnsi font; characters
+    outside cp1252 become "?".
+    """
+    raw = text.encode("cp1252", errors="replace")
+    raw = raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+    return b"(" + raw + b")"
+
+
+def _num(v):
+    """
+    Format a number for a PDF content stream (no exponent, trimmed).
+    """
+    if isinstance(v, int):
+        return b"%d" % v
+    s = b"%.4f" % v
+    s = s.rstrip(b"0").rstrip(b".")
+    return s if s not in (b"", b"-0") else b"0"
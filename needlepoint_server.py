@@ -0,0 +1,512 @@
+"""
+Local HTTP service: submit an image with pattern settings, get a job id,
+poll it, then download the legend, PDFs or project file.
+
+    python3 needlepoint_server.py --port 8765 --workers 2 --cache-dir pattern_cache/
+
+    curl --data-binary @cat.jpg "http://127.0.0.1:8765/jobs?grid_max=120&color_count=30"
+        -> {"job": "3f2a...", "status": "queued", "cached": false}
+    curl http://127.0.0.1:8765/jobs/3f2a...
+        -> {"job": ..., "status": "done", "outputs": ["legend", "color", "symbols"], ...}
+    curl -O http://127.0.0.1:8765/jobs/3f2a.../color
+    curl http://127.0.0.1:8765/metrics
+
+Settings are the batch-mode settings (needlepoint_batch.DEFAULT_SETTINGS)
+given as query parameters; outputs is a comma-separated list. A job id is
+the hash of the image bytes, the settings and the DMC palette, so:
+
+  - a request identical to a finished one is answered from the on-disk
+    result cache without running anything;
+  - a request identical to one still queued or running joins that job.
+
+Jobs wait in a bounded queue (503 when full) and run on a fixed pool of
+worker processes, each a needlepoint_batch.run_job() call. Finished
+results are written to a temp folder and renamed into the cache, which
+is trimmed oldest-first past --cache-mb.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import queue
+import shutil
+import hashlib
+import contextlib
+import argparse
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+import needlepoint_designer_plus as nd
+import needlepoint_batch as batch
+
+
+CONTENT_TYPES = {
+    ".csv": "text/csv; charset=utf-8",
+    ".pdf": "application/pdf",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    nd.PROJECT_EXT: "application/octet-stream",
+}
+
+RESULT_FILE = "result.json"
+JOB_KEY_PATTERN = re.compile(r"[0-9a-f]{40}")  # job_key() digests; anything else is a 404
+LATENCY_WINDOW = 1000  # recent jobs kept for the latency percentiles
+MAX_JOBS_KEPT = 10000  # finished jobs remembered in memory
+
+
+# ============================================================
+#  SETTINGS
+# ============================================================
+
+def parse_settings(query):
+    """
+    Job settings from URL query parameters, typed after DEFAULT_SETTINGS
+    and checked with needlepoint_batch.check_setting(). Raises
+    ValueError on unknown names, unparsable or out-of-range values.
+    """
+    settings = dict(batch.DEFAULT_SETTINGS)
+    for name, values in parse_qs(query, keep_blank_values=True).items():
+        if name not in settings:
+            raise ValueError(f"unknown setting {name!r}")
+        raw = values[-1]
+        default = batch.DEFAULT_SETTINGS[name]
+        try:
+            if isinstance(default, bool):
+                if raw.lower() not in ("1", "0", "true", "false", "yes", "no"):
+                    raise ValueError(raw)
+                value = raw.lower() in ("1", "true", "yes")
+            elif isinstance(default, int):
+                value = int(raw)
+            elif isinstance(default, float):
+                value = float(raw)
+            elif isinstance(default, list):
+                value = [v.strip() for v in raw.split(",") if v.strip()]
+            else:
+                value = raw
+        except ValueError:
+            raise ValueError(f"bad value for {name}: {raw!r}")
+        settings[name] = batch.check_setting(name, value)
+    return settings
+
+
+def job_key(image_bytes, settings):
+    """
+    Content address of a job: image bytes + settings + DMC palette.
+    """
+    h = hashlib.sha256()
+    h.update(hashlib.sha256(image_bytes).digest())
+    h.update(json.dumps(settings, sort_keys=True).encode("utf-8"))
+    h.update(nd._palette_fingerprint().encode("ascii"))
+    return h.hexdigest()[:40]
+
+
+def percentiles(values, points=(50, 90, 99)):
+    """
+    Nearest-rank percentiles of values (ms), {"p50": ..., ...}.
+    """
+    if not values:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(values)
+    return {
+        f"p{p}": round(ordered[min(len(ordered) - 1, max(0, -(-p * len(ordered) // 100) - 1))], 1)
+        for p in points
+    }
+
+
+# ============================================================
+#  RESULT CACHE (content-addressed folders on disk)
+# ============================================================
+
+class ResultCache:
+    """
+    One folder per job key holding the job's files and result.json.
+    Folders appear by rename once complete, so a folder that exists is
+    always whole. Trimmed by least recent use past max_bytes.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        # Leftovers of jobs interrupted by a previous shutdown
+        for name in os.listdir(root):
+            if name.endswith(".partial"):
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def get(self, key):
+        """
+        The stored result dict for key, or None.
+        """
+        try:
+            with open(os.path.join(self.path(key), RESULT_FILE), encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Recency for trimming; the entry may have been trimmed since the read
+        with contextlib.suppress(OSError):
+            os.utime(self.path(key))
+        return result
+
+    def workspace(self, key):
+        """
+        Empty temp folder to run a job in; publish() moves it into place.
+        """
+        work = self.path(key) + ".partial"
+        shutil.rmtree(work, ignore_errors=True)
+        os.makedirs(work)
+        return work
+
+    def publish(self, key, work, result):
+        with open(os.path.join(work, RESULT_FILE), "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        final = self.path(key)
+        with self._lock:
+            if os.path.exists(final):
+                shutil.rmtree(work, ignore_errors=True)  # a twin got there first
+            else:
+                os.replace(work, final)
+            self._trim()
+
+    def _trim(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if not entry.is_dir() or entry.name.endswith(".partial"):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            entries.append((entry.stat().st_mtime, size, entry.path))
+            total += size
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+# ============================================================
+#  SERVICE (queue, worker pool, dedupe, metrics)
+# ============================================================
+
+class PatternService:
+    """
+    Accepts jobs, runs them on `workers` processes through a queue of at
+    most queue_size waiting jobs, and keeps the counters behind /metrics.
+    """
+
+    def __init__(self, cache_dir, workers=2, queue_size=64, cache_bytes=2 << 30,
+                 palette_path="dmc_palette_full.csv"):
+        self.cache = ResultCache(cache_dir, cache_bytes)
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=batch._init_worker, initargs=(palette_path,)
+        )
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # key -> job dict (see submit)
+        self._running = 0
+        self._latency = deque(maxlen=LATENCY_WINDOW)  # submit -> done, ms
+        self._wait = deque(maxlen=LATENCY_WINDOW)  # submit -> started, ms
+        self.counters = dict.fromkeys(
+            ("submitted", "cache_hits", "deduplicated", "completed", "failed", "rejected"), 0
+        )
+        self.started = time.time()
+        self._dispatchers = [
+            threading.Thread(target=self._dispatch, name=f"dispatch-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for t in self._dispatchers:
+            t.start()
+
+    # ---------------------------
+    def submit(self, image_bytes, settings):
+        """
+        Queue a job (or find it). Returns (job snapshot, cached). Raises
+        queue.Full when the queue is at capacity.
+        """
+        key = job_key(image_bytes, settings)
+        with self._lock:
+            self.counters["submitted"] += 1
+            job = self._jobs.get(key)
+            if job is not None and job["status"] in ("queued", "running"):
+                self.counters["deduplicated"] += 1
+                return dict(job), False
+
+        stored = self.cache.get(key)
+        if stored is not None:
+            with self._lock:
+                self.counters["cache_hits"] += 1
+                job = self._remember(key, dict(stored, status="done"))
+            return dict(job), True
+
+        job = {"job": key, "status": "queued", "submitted": time.time()}
+        with self._lock:
+            # Recheck: an identical request may have queued it meanwhile
+            twin = self._jobs.get(key)
+            if twin is not None and twin["status"] in ("queued", "running"):
+                self.counters["deduplicated"] += 1
+                return dict(twin), False
+            try:
+                self._queue.put_nowait((key, image_bytes, settings))
+            except queue.Full:
+                self.counters["rejected"] += 1
+                raise
+            self._remember(key, job)
+            return dict(job), False
+
+    def _remember(self, key, job):
+        self._jobs[key] = job
+        self._jobs.move_to_end(key)
+        while len(self._jobs) > MAX_JOBS_KEPT:
+            self._jobs.popitem(last=False)
+        return job
+
+    def status(self, key):
+        """
+        Job dict for key: in memory if seen since startup, else from the
+        cache. None if unknown (or not a job key at all).
+        """
+        if not JOB_KEY_PATTERN.fullmatch(key):
+            return None  # never a path into or out of the cache
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                return dict(job)  # workers update the original
+        stored = self.cache.get(key)
+        return None if stored is None else dict(stored, status="done")
+
+    def artifact_path(self, key, name):
+        """
+        Path of a finished job's artifact ("legend", "color", ...), or None.
+        """
+        job = self.status(key)
+        if job is None or job["status"] != "done" or name not in job.get("files", {}):
+            return None
+        folder = os.path.realpath(self.cache.path(key))
+        path = os.path.realpath(os.path.join(folder, job["files"][name]))
+        if os.path.commonpath([folder, path]) != folder:
+            return None  # result.json names a file outside the job's folder
+        return path
+
+    # ---------------------------
+    def _dispatch(self):
+        # One dispatcher per worker process: the queue, not the pool's own
+        # backlog, holds waiting jobs, so queue depth is what clients see.
+        while True:
+            key, image_bytes, settings = self._queue.get()
+            started = time.time()
+            with self._lock:
+                job = self._jobs.get(key)
+                self._running += 1
+                if job is not None:
+                    job["status"] = "running"
+                self._wait.append((started - job["submitted"]) * 1000 if job else 0.0)
+            try:
+                result = self._run(key, image_bytes, settings)
+            except Exception as e:  # pool broken, disk full, ...
+                result = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+            finished = time.time()
+            with self._lock:
+                self._running -= 1
+                if result["status"] == "ok":
+                    self.counters["completed"] += 1
+                    update = dict(result, status="done")
+                else:
+                    self.counters["failed"] += 1
+                    update = {"status": "error", "error": result["error"]}
+                if job is not None:
+                    job.update(update)
+                    self._latency.append((finished - job["submitted"]) * 1000)
+            self._queue.task_done()
+
+    def _run(self, key, image_bytes, settings):
+        work = self.cache.workspace(key)
+        source = os.path.join(work, "pattern")
+        with open(source, "wb") as f:
+            f.write(image_bytes)
+        try:
+            result = self._pool.submit(batch.run_job, source, settings, work).result()
+        finally:
+            os.remove(source)
+        if result["status"] != "ok":
+            shutil.rmtree(work, ignore_errors=True)
+            return result
+
+        stored = {
+            "job": key,
+            "settings": settings,
+            "size": result.get("size"),
+            "timings": result["timings"],
+            "outputs": list(result["outputs"]),
+            "files": {name: os.path.basename(p) for name, p in result["outputs"].items()},
+        }
+        self.cache.publish(key, work, stored)
+        return dict(stored, status="ok")
+
+    # ---------------------------
+    def metrics(self):
+        with self._lock:
+            counters = dict(self.counters)
+            running = self._running
+            latency = list(self._latency)
+            wait = list(self._wait)
+        lookups = counters["cache_hits"] + counters["completed"] + counters["failed"]
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "workers": self.workers,
+            "running": running,
+            "queue_depth": self._queue.qsize(),
+            "queue_capacity": self._queue.maxsize,
+            "jobs": counters,
+            "cache_hit_rate": round(counters["cache_hits"] / lookups, 3) if lookups else None,
+            "latency_ms": dict(percentiles(latency), count=len(latency)),
+            "queue_wait_ms": percentiles(wait),
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ============================================================
+#  HTTP
+# ============================================================
+
+class Handler(BaseHTTPRequestHandler):
+    service = None  # set by make_server()
+    max_upload = 64 << 20
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, code, body, headers=()):
+        data = json.dumps(body, indent=2).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, code, message, headers=()):
+        self._send_json(code, {"error": message}, headers)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") != "/jobs":
+            return self._error(404, "not found")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            return self._error(400, "send the image as the request body")
+        if length > self.max_upload:
+            return self._error(413, f"image larger than {self.max_upload >> 20} MB")
+        image_bytes = self.rfile.read(length)
+        try:
+            settings = parse_settings(url.query)
+        except ValueError as e:
+            return self._error(400, str(e))
+        try:
+            job, cached = self.service.submit(image_bytes, settings)
+        except queue.Full:
+            return self._error(503, "queue full, retry later", [("Retry-After", "5")])
+        self._send_json(
+            200 if job["status"] == "done" else 202,
+            {"job": job["job"], "status": job["status"], "cached": cached},
+            [("Location", f"/jobs/{job['job']}")],
+        )
+
+    def do_GET(self):
+        parts = [p for p in urlsplit(self.path).path.split("/") if p]
+        if parts == ["health"]:
+            return self._send_json(200, {"ok": True})
+        if parts == ["metrics"]:
+            return self._send_json(200, self.service.metrics())
+        if len(parts) == 2 and parts[0] == "jobs":
+            job = self.service.status(parts[1])
+            if job is None:
+                return self._error(404, "unknown job")
+            return self._send_json(200, job)
+        if len(parts) == 3 and parts[0] == "jobs":
+            path = self.service.artifact_path(parts[1], parts[2])
+            if path is None or not os.path.exists(path):
+                return self._error(404, "no such artifact (job unknown, unfinished or failed?)")
+            return self._send_file(path)
+        self._error(404, "not found")
+
+    def _send_file(self, path):
+        ext = os.path.splitext(path)[1].lower()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES.get(ext, "application/octet-stream"))
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(path)}"')
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def log_message(self, fmt, *args):
+        if self.server.verbose:
+            super().log_message(fmt, *args)
+
+
+def make_server(service, host="127.0.0.1", port=8765, max_upload_mb=64, verbose=False):
+    """
+    ThreadingHTTPServer serving `service` (port 0 picks a free port).
+    """
+    handler = type("PatternHandler", (Handler,), {"service": service, "max_upload": max_upload_mb << 20})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.verbose = verbose
+    return server
+
+
+# ============================================================
+#  COMMAND LINE
+# ============================================================
+
+def build_parser():
+    p = argparse.ArgumentParser(description="Local HTTP service for pattern generation.")
+    p.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                   help="worker processes running jobs")
+    p.add_argument("--queue-size", type=int, default=64, help="jobs allowed to wait (503 past this)")
+    p.add_argument("--cache-dir", default="pattern_cache", help="result cache folder")
+    p.add_argument("--cache-mb", type=int, default=2048, help="result cache budget")
+    p.add_argument("--max-upload-mb", type=int, default=64)
+    p.add_argument("--palette", default="dmc_palette_full.csv", help="DMC palette CSV")
+    p.add_argument("--verbose", action="store_true", help="log every request")
+    return p
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    for message in nd.load_dmc_palette(args.palette):
+        print(f"Warning: DMC palette: {message}", file=sys.stderr)
+
+    service = PatternService(
+        args.cache_dir,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        cache_bytes=args.cache_mb << 20,
+        palette_path=args.palette,
+    )
+    server = make_server(service, args.host, args.port, args.max_upload_mb, args.verbose)
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]} "
+          f"({args.workers} workers, cache {args.cache_dir})", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+"""
+Minimal xlsx workbook writer.
+
+Each sheet is built as one XML string from its rows and written to the
+zip in a single call; cell fills are collected into one style table, one
+entry per distinct color, so a 466-row palette costs 466 fills at most.
+Used for the palette and legend workbooks with pre-colored swatch cells
+(no spreadsheet script needed to color them).
+
+    with XlsxWriter("palette.xlsx") as book:
+        book.add_sheet(
+            "DMC",
+            ["Number", "Name", "Color"],
+            [["310", "Black", ""], ["321", "Red", ""]],
+            fills={2: [(0, 0, 0), (199, 43, 59)]},
+        )
+"""
+
+import zipfile
+from xml.sax.saxutils import escape
+
+_MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+_XML_HEAD = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# Style ids fixed by _styles_xml(); swatch fills are appended after these
+_STYLE_PLAIN = 0
+_STYLE_HEADER = 1
+
+
+def column_letter(index):
+    """
+    Spreadsheet column name of a 0-based column index (0 -> A, 26 -> AA).
+    """
+    name = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        name = chr(65 + rem) + name
+    return name
+
+
+def _cell(ref, value, style):
+    s = f' s="{style}"' if style else ""
+    if value is None or value == "":
+        return f'<c r="{ref}"{s}/>' if style else ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}"{s} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"{s}><v>{value!r}</v></c>'
+    return f'<c r="{ref}"{s} t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+
+class XlsxWriter:
+    def __init__(self, path):
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        self._sheets = []  # sheet names, in order
+        self._fill_styles = {}  # (r, g, b) -> cell style id
+
+    # ---------------------------
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._zip.close()
+
+    # ---------------------------
+    def _fill_style(self, rgb):
+        style = self._fill_styles.get(rgb)
+        if style is None:
+            style = self._fill_styles[rgb] = 2 + len(self._fill_styles)
+        return style
+
+    def add_sheet(self, name, columns, rows, fills=None, widths=None):
+        """
+        Write a sheet: a bold, frozen header row of `columns`, then `rows`
+        (lists of str / int / float values). fills maps a column index to
+        one (r, g, b) per row (None leaves that cell unfilled); widths
+        maps a column index to a width in characters.
+        """
+        fills = fills or {}
+        letters = [column_letter(c) for c in range(len(columns))]
+        fill_styles = {
+            c: [None if rgb is None else self._fill_style(tuple(int(v) for v in rgb)) for rgb in colors]
+            for c, colors in fills.items()
+        }
+
+        parts = ['<row r="1">']
+        parts.extend(_cell(f"{letters[c]}1", title, _STYLE_HEADER) for c, title in enumerate(columns))
+        parts.append("</row>")
+        for i, values in enumerate(rows):
+            r = i + 2
+            parts.append(f'<row r="{r}">')
+            for c, value in enumerate(values):
+                style = _STYLE_PLAIN
+                if c in fill_styles:
+                    style = fill_styles[c][i] or _STYLE_PLAIN
+                parts.append(_cell(f"{letters[c]}{r}", value, style))
+            parts.append("</row>")
+
+        cols = ""
+        if widths:
+            cols = "<cols>%s</cols>" % "".join(
+                f'<col min="{c + 1}" max="{c + 1}" width="{w}" customWidth="1"/>' for c, w in sorted(widths.items())
+            )
+        xml = (
+            f'{_XML_HEAD}<worksheet xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}">'
+            '<sheetViews><sheetView workbookViewId="0">'
+            '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+            "</sheetView></sheetViews>"
+            f"{cols}<sheetData>{''.join(parts)}</sheetData></worksheet>"
+        )
+        self._sheets.append(name)
+        self._zip.writestr(f"xl/worksheets/sheet{len(self._sheets)}.xml", xml)
+
+    # ---------------------------
+    def _styles_xml(self):
+        fills = ['<fill><patternFill patternType="none"/></fill>', '<fill><patternFill patternType="gray125"/></fill>']
+        xfs = [
+            '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>',
+            '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>',
+        ]
+        for rgb in self._fill_styles:  # dicts keep insertion order == style id order
+            argb = "FF%02X%02X%02X" % rgb
+            fills.append(
+                f'<fill><patternFill patternType="solid"><fgColor rgb="{argb}"/><bgColor rgb="{argb}"/></patternFill></fill>'
+            )
+            xfs.append(f'<xf numFmtId="0" fontId="0" fillId="{len(fills) - 1}" borderId="0" xfId="0" applyFill="1"/>')
+        return (
+            f'{_XML_HEAD}<styleSheet xmlns="{_MAIN_NS}">'
+            '<fonts count="2"><font><sz val="10"/><name val="Arial"/></font>'
+            '<font><b/><sz val="10"/><name val="Arial"/></font></fonts>'
+            f'<fills count="{len(fills)}">{"".join(fills)}</fills>'
+            '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+            '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            f'<cellXfs count="{len(xfs)}">{"".join(xfs)}</cellXfs>'
+            '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+            "</styleSheet>"
+        )
+
+    def close(self):
+        """
+        Write the workbook, styles and package parts, then close the file.
+        """
+        n = len(self._sheets)
+        sheets = "".join(
+            f'<sheet name="{escape(name, {chr(34): "&quot;"})}" sheetId="{i}" r:id="rId{i}"/>'
+            for i, name in enumerate(self._sheets, 1)
+        )
+        rels = "".join(
+            f'<Relationship Id="rId{i}" Type="{_REL_NS}/worksheet" Target="worksheets/sheet{i}.xml"/>'
+            for i in range(1, n + 1)
+        )
+        overrides = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, n + 1)
+        )
+        z = self._zip
+        z.writestr("xl/styles.xml", self._styles_xml())
+        z.writestr(
+            "xl/workbook.xml",
+            f'{_XML_HEAD}<workbook xmlns="{_MAIN_NS}" xmlns:r="{_REL_NS}"><sheets>{sheets}</sheets></workbook>',
+        )
+        z.writestr(
+            "xl/_rels/workbook.xml.rels",
+            f'{_XML_HEAD}<Relationships xmlns="{_PKG_REL_NS}">{rels}'
+            f'<Relationship Id="rId{n + 1}" Type="{_REL_NS}/styles" Target="styles.xml"/></Relationships>',
+        )
+        z.writestr(
+            "_rels/.rels",
+            f'{_XML_HEAD}<Relationships xmlns="{_PKG_REL_NS}">'
+            f'<Relationship Id="rId1" Type="{_REL_NS}/officeDocument" Target="xl/workbook.xml"/></Relationships>',
+        )
+        z.writestr(
+            "[Content_Types].xml",
+            f'{_XML_HEAD}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            f"{overrides}</Types>",
+        )
+        z.close()
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import needlepoint_batch as batch
+
+
+def write_manifest(tmp_path, *entries):
+    path = tmp_path / "jobs.jsonl"
+    path.write_text("\n".join(json.dumps(e) for e in entries) + "\n")
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "entry",
+    [
+        {"outputs": "legend"},
+        {"outputs": ["legend", "poster"]},
+        {"grid_max": "120"},
+        {"grid_max": 1.5},
+        {"color_count": True},
+        {"cleanup": 2},
+        {"tiled": "yes"},
+        {"quantizer": "bogus"},
+        {"strands": 0},
+    ],
+)
+def test_bad_manifest_settings_are_rejected(tmp_path, entry):
+    manifest = write_manifest(tmp_path, dict(entry, image="cat.jpg"))
+    with pytest.raises(ValueError, match="jobs.jsonl:1"):
+        batch.read_manifest(manifest, dict(batch.DEFAULT_SETTINGS))
+
+
+def test_manifest_settings_are_checked_and_kept(tmp_path):
+    manifest = write_manifest(tmp_path, {"image": "cat.jpg", "cleanup": 1, "outputs": ["legend"], "grid_max": 90})
+    [(image, settings)] = batch.read_manifest(manifest, dict(batch.DEFAULT_SETTINGS))
+    assert image == str(tmp_path / "cat.jpg")
+    assert settings["cleanup"] == 1.0 and isinstance(settings["cleanup"], float)
+    assert settings["outputs"] == ["legend"]
+    assert settings["grid_max"] == 90
+
+
+def test_same_output_names_are_refused(tmp_path):
+    jobs = [("a/cat.jpg", {}), ("b/cat.png", {}), ("b/dog.jpg", {})]
+    assert batch.output_clashes(jobs) == [["a/cat.jpg", "b/cat.png"]]
+    with pytest.raises(ValueError, match="overwrite"):
+        batch.run_batch(jobs, str(tmp_path / "out"), workers=1)
+    assert not (tmp_path / "out").exists()
+    assert batch.main(["a/cat.jpg", "b/Cat.jpg", "--out", str(tmp_path / "out")]) == 2
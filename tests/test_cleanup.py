@@ -0,0 +1,159 @@
+from collections import deque
+
+import numpy as np
+import pytest
+
+import needlepoint_designer_plus as nd
+
+
+def grid(rows, colors=None):
+    idx = np.array(rows)
+    colors = colors or int(idx.max()) + 1
+    palette = [(40 * i, 255 - 40 * i, (90 * i) % 256) for i in range(colors)]
+    return nd.Pattern(idx, palette)
+
+
+def flood_regions(idx):
+    """
+    Reference labelling: breadth-first flood fill, 4-connected.
+    """
+    h, w = idx.shape
+    labels = np.full((h, w), -1)
+    n = 0
+    for y in range(h):
+        for x in range(w):
+            if labels[y, x] >= 0:
+                continue
+            labels[y, x] = n
+            todo = deque([(y, x)])
+            while todo:
+                cy, cx = todo.popleft()
+                for ny, nx in ((cy - 1, cx), (cy + 1, cx), (cy, cx - 1), (cy, cx + 1)):
+                    if 0 <= ny < h and 0 <= nx < w and labels[ny, nx] < 0 and idx[ny, nx] == idx[cy, cx]:
+                        labels[ny, nx] = n
+                        todo.append((ny, nx))
+            n += 1
+    return labels
+
+
+def same_partition(a, b):
+    pairs = set(zip(a.ravel().tolist(), b.ravel().tolist()))
+    return len(pairs) == len(np.unique(a)) == len(np.unique(b))
+
+
+# ---- _label_regions ----
+
+def test_diagonal_neighbours_are_separate_regions():
+    labels, sizes = nd._label_regions(np.array([[0, 1], [1, 0]]))
+    assert len(set(labels.ravel().tolist())) == 4
+    assert sizes.tolist() == [1, 1, 1, 1]
+
+
+def test_orthogonal_neighbours_join_across_rows():
+    # The 0s form a U: rows only meet through the bottom row
+    idx = np.array([
+        [0, 1, 0],
+        [0, 1, 0],
+        [0, 0, 0],
+    ])
+    labels, sizes = nd._label_regions(idx)
+    assert len(sizes) == 2
+    assert sorted(sizes.tolist()) == [2, 7]
+    assert len(set(labels[idx == 0].tolist())) == 1
+
+
+def test_diagonal_staircase_stays_split():
+    idx = np.eye(4, dtype=np.uint8)
+    labels, sizes = nd._label_regions(idx)
+    assert (sizes[labels[idx == 1]] == 1).all()
+    # The 0s above and below the diagonal only touch at corners
+    assert labels[0, 3] != labels[3, 0]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_labels_match_flood_fill(seed):
+    idx = np.random.default_rng(seed).integers(0, 3, (17, 23))
+    labels, sizes = nd._label_regions(idx)
+    assert same_partition(labels, flood_regions(idx))
+    assert sizes.tolist() == np.bincount(labels.ravel()).tolist()
+
+
+# ---- remove_small_regions ----
+
+def island(size):
+    # a 1 x size bar of color 1 on a 7x7 field of color 0
+    idx = np.zeros((7, 7), dtype=np.uint8)
+    idx[3, 1:1 + size] = 1
+    return grid(idx.tolist())
+
+
+def test_region_of_exactly_min_size_is_kept():
+    p = island(3)
+    out = nd.remove_small_regions(p, min_size=3)
+    assert np.array_equal(out.indices, p.indices)
+
+
+def test_region_below_min_size_is_absorbed():
+    out = nd.remove_small_regions(island(3), min_size=4)
+    assert (out.indices == 0).all()
+
+
+def test_small_region_joins_largest_neighbour():
+    idx = [
+        [0, 0, 0, 2],
+        [0, 1, 0, 2],
+        [0, 0, 0, 2],
+    ]
+    out = nd.remove_small_regions(grid(idx), min_size=2)
+    assert out.indices[1, 1] == 0
+    assert (out.indices[:, 3] == 2).all()
+
+
+# ---- majority_filter ----
+
+def test_majority_replaces_outnumbered_stitch():
+    idx = [
+        [1, 1, 1],
+        [1, 2, 1],
+        [1, 1, 1],
+    ]
+    out = nd.majority_filter(grid(idx), min_votes=5)
+    assert out.indices[1, 1] == 1
+
+
+def test_majority_tie_keeps_own_color():
+    # Center 0 has 4 votes, color 1 also has 4: no strict majority
+    idx = [
+        [1, 1, 1],
+        [1, 0, 0],
+        [0, 0, 2],
+    ]
+    out = nd.majority_filter(grid(idx), min_votes=4)
+    assert out.indices[1, 1] == 0
+
+
+def test_majority_needs_min_votes():
+    # Color 1 beats the center's single vote but only has 5 of 9
+    idx = [
+        [1, 1, 1],
+        [1, 2, 3],
+        [1, 3, 3],
+    ]
+    assert nd.majority_filter(grid(idx), min_votes=6).indices[1, 1] == 2
+    assert nd.majority_filter(grid(idx), min_votes=5).indices[1, 1] == 1
+
+
+# ---- no-op cases ----
+
+def test_strength_zero_is_a_no_op():
+    p = grid(np.random.default_rng(0).integers(0, 5, (12, 9)).tolist())
+    assert nd.clean_pattern(p, 0.0) is p
+    assert nd.merge_similar_colors(p, 0.0) is p
+    assert nd.remove_small_regions(p, 1) is p
+
+
+def test_full_strength_leaves_no_region_below_minimum():
+    p = grid(np.random.default_rng(1).integers(0, 6, (30, 30)).tolist())
+    out = nd.clean_pattern(p, 1.0)
+    _, sizes = nd._label_regions(out.indices)
+    assert sizes.min() >= 9
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+
+import needlepoint_designer_plus as nd
+
+PALETTE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dmc_palette_full.csv")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def palette():
+    nd.load_dmc_palette(PALETTE_CSV, use_cache=False)
+
+
+def test_pick_threads_returns_requested_count():
+    for seed in range(20):
+        rng = np.random.default_rng(seed)
+        pixels = rng.integers(0, 256, (rng.integers(20, 400), 3)).astype(np.float64)
+        voted = len(np.unique(nd.match_dmc_pixels(pixels, True, "de76", lut_bits=5)))
+        for colors in (1, 3, 8, 40):
+            threads = nd._pick_threads(pixels, colors, True)
+            assert len(threads) == min(colors, voted)
+            assert len(np.unique(threads)) == len(threads)
+
+
+def test_refill_after_collapsed_clusters():
+    rows = np.arange(10, 30)
+    weights = np.ones(len(rows))
+    weights[-1] = 100.0
+    collapsed = np.array([10, 11])  # four clusters that snapped onto two threads
+    threads = nd._refill_threads(collapsed, rows, weights, 4)
+    assert len(threads) == 4
+    assert set(collapsed) <= set(threads)
+    assert set(threads) <= set(rows)
+    assert nd._refill_threads(np.arange(10, 14), rows, weights, 4).tolist() == [10, 11, 12, 13]
+
+
+@pytest.fixture
+def palette_copy(tmp_path, monkeypatch):
+    monkeypatch.setattr(nd, "LUT_CACHE_DIR", str(tmp_path / "cache"))
+    parsed = []
+    parse = nd._parse_palette_csv
+
+    def counting_parse(csv_path):
+        parsed.append(csv_path)
+        return parse(csv_path)
+
+    monkeypatch.setattr(nd, "_parse_palette_csv", counting_parse)
+    path = tmp_path / "palette.csv"
+    with open(PALETTE_CSV, "rb") as f:
+        path.write_bytes(f.read())
+    yield str(path), parsed
+    nd.load_dmc_palette(PALETTE_CSV, use_cache=False)
+
+
+def test_palette_cache_survives_touch(palette_copy):
+    path, parsed = palette_copy
+    nd.load_dmc_palette(path)
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    nd.load_dmc_palette(path)
+    assert len(parsed) == 1
+
+
+def test_palette_cache_rejects_same_size_edit(palette_copy):
+    path, parsed = palette_copy
+    nd.load_dmc_palette(path)
+    st = os.stat(path)
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    assert "B5200,Snow White,255,255,255," in text
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text.replace("B5200,Snow White,255,255,255,", "B5200,Snow White,255,255,250,", 1))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))  # same size, same mtime
+    nd.load_dmc_palette(path)
+    assert len(parsed) == 2
+    assert nd.DMC_PALETTE[nd.dmc_index("B5200")]["b"] == 250
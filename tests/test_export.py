@@ -0,0 +1,92 @@
+import os
+import threading
+
+import numpy as np
+
+import needlepoint_designer_plus as nd
+
+
+def small_pattern():
+    rng = np.random.default_rng(0)
+    return nd.Pattern(rng.integers(0, 5, (30, 24)), rng.integers(0, 256, (5, 3)))
+
+
+def test_concurrent_exports_to_one_target(tmp_path):
+    pattern = small_pattern()
+    target = str(tmp_path / "chart.pdf")
+    errors = []
+
+    def export(tiled):
+        try:
+            nd.export_chart_pdf(pattern, target, 8, tiled=tiled)
+        except Exception as e:  # collected for the assertion below
+            errors.append(e)
+
+    threads = [threading.Thread(target=export, args=(i % 2 == 0,)) for i in range(6)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert os.listdir(tmp_path) == ["chart.pdf"]
+    with open(target, "rb") as f:
+        assert f.read(5) == b"%PDF-"
+
+
+def test_failed_write_leaves_target_untouched(tmp_path):
+    target = tmp_path / "legend.csv"
+    target.write_text("old")
+    try:
+        with nd.atomic_output(str(target)) as tmp:
+            with open(tmp, "w") as f:
+                f.write("partial")
+            raise RuntimeError("cancelled")
+    except RuntimeError:
+        pass
+    assert target.read_text() == "old"
+    assert os.listdir(tmp_path) == ["legend.csv"]
+
+
+def test_page_canvas_released_after_export(tmp_path):
+    nd.export_chart_pdf(small_pattern(), str(tmp_path / "chart.pdf"), 8)
+    assert getattr(nd._PAGE_CANVAS, "page", None) is None
+
+
+def test_legend_keeps_original_columns_first(tmp_path):
+    import csv
+
+    pattern = small_pattern()
+    for legend_stats in (True, False):
+        base_root = str(tmp_path / f"p{int(legend_stats)}")
+        written = nd.export_pattern(
+            pattern,
+            base_root,
+            include_dmc=False,
+            export_color=False,
+            export_symbols=False,
+            legend_stats=legend_stats,
+            strands=2,
+        )
+        with open(written["legend"], newline="", encoding="utf-8") as f:
+            header, *rows = list(csv.reader(f))
+        assert header[:9] == list(nd.LEGEND_BASE_COLUMNS)
+        assert header == list(nd.LEGEND_COLUMNS if legend_stats else nd.LEGEND_BASE_COLUMNS)
+        assert all(len(row) == len(header) for row in rows)
+
+    full = nd.cached_stats(pattern, strands=nd.SKEIN_STRANDS)
+    two = nd.cached_stats(pattern, strands=2)
+    assert nd.cached_stats(pattern) is full
+    assert np.all(two["skeins"] < full["skeins"])
+
+
+def test_atomic_output_uses_process_umask(tmp_path, monkeypatch):
+    current = os.umask(0o027)
+    os.umask(current)
+    assert nd._process_umask() == current
+    monkeypatch.setattr(nd, "_UMASK", 0o027)
+    target = tmp_path / "out.csv"
+    with nd.atomic_output(str(target)) as tmp:
+        with open(tmp, "w") as f:
+            f.write("x")
+    assert os.stat(target).st_mode & 0o777 == 0o640
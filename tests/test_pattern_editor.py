@@ -0,0 +1,76 @@
+import csv
+
+import numpy as np
+import pytest
+
+import needlepoint_designer_plus as nd
+
+
+def random_pattern(w=30, h=22, colors=6, seed=0):
+    rng = np.random.default_rng(seed)
+    palette = rng.integers(0, 256, (colors, 3))
+    return nd.Pattern(rng.integers(0, colors, (h, w)), palette)
+
+
+def random_edits(editor, rng, steps):
+    w, h = editor.pattern.width, editor.pattern.height
+    for _ in range(steps):
+        k = len(editor.counts)
+        kind = rng.integers(0, 4)
+        if kind == 0:
+            editor.set_stitch(int(rng.integers(0, w)), int(rng.integers(0, h)), int(rng.integers(0, k)))
+        elif kind == 1:
+            x0, y0 = int(rng.integers(-2, w)), int(rng.integers(-2, h))
+            editor.fill_rect(x0, y0, x0 + int(rng.integers(1, 6)), y0 + int(rng.integers(1, 6)), int(rng.integers(0, k)))
+        elif kind == 2:
+            editor.merge_colors(int(rng.integers(0, k)), int(rng.integers(0, k)))
+        else:
+            editor.replace_color(int(rng.integers(0, k)), tuple(int(v) for v in rng.integers(0, 256, 3)))
+
+
+@pytest.mark.parametrize("cell_px", [7, 18])
+@pytest.mark.parametrize("symbols", [False, True])
+def test_patched_chart_matches_full_render(cell_px, symbols):
+    editor = nd.PatternEditor(random_pattern())
+    rng = np.random.default_rng(cell_px + symbols)
+    editor.chart(cell_px, symbols)
+    for _ in range(12):
+        random_edits(editor, rng, int(rng.integers(1, 5)))
+        patched = editor.chart(cell_px, symbols)
+        full = nd.render_pattern_image(
+            editor.pattern, cell_px, numbered=True, symbols=symbols, palette_map=editor.symbol_of
+        )
+        assert patched.size == full.size
+        assert patched.tobytes() == full.tobytes()
+
+
+def test_live_counts_and_legend_track_edits():
+    editor = nd.PatternEditor(random_pattern())
+    random_edits(editor, np.random.default_rng(1), 40)
+    counts = np.bincount(editor.pattern.indices.ravel(), minlength=len(editor.pattern.palette))
+    assert np.array_equal(editor.counts, counts)
+    order, _, _ = editor.legend()
+    assert sorted(order.tolist()) == np.flatnonzero(counts).tolist()
+    assert np.all(np.diff(counts[order]) <= 0)
+    assert np.array_equal(editor.stats()["counts"], counts)
+
+
+def test_export_uses_editor_outputs(tmp_path, monkeypatch):
+    editor = nd.PatternEditor(random_pattern())
+    random_edits(editor, np.random.default_rng(2), 20)
+    editor.chart(10)
+
+    def no_full_render(*args, **kwargs):
+        raise AssertionError("export re-rendered the whole chart")
+
+    monkeypatch.setattr(nd, "cached_chart", no_full_render)
+    written = nd.export_pattern(
+        editor.pattern, str(tmp_path / "p"), cell_px=10, include_dmc=False, editor=editor, workers=1
+    )
+    assert set(written) == {"legend", "color", "symbols"}
+
+    with open(written["legend"], newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    order, symbol_of, counts = editor.legend()
+    assert [row["symbol"] for row in rows] == [symbol_of[i] for i in order]
+    assert [int(row["stitches"]) for row in rows] == counts[order].tolist()
@@ -0,0 +1,60 @@
+import csv
+import os
+
+import numpy as np
+
+import needlepoint_designer_plus as nd
+
+PALETTE_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dmc_palette_full.csv")
+
+
+def small_pattern():
+    rng = np.random.default_rng(3)
+    return nd.Pattern(rng.integers(0, 6, (20, 26)), rng.integers(0, 256, (6, 3)))
+
+
+def test_project_keeps_caller_symbols(tmp_path):
+    pattern = small_pattern()
+    editor = nd.PatternEditor(pattern)
+    editor.set_stitch(0, 0, editor.color_index((1, 2, 3)))
+    path = str(tmp_path / "p.loom")
+    nd.save_project(path, editor.pattern, symbol_of=editor.symbol_of)
+    assert os.listdir(tmp_path) == ["p.loom"]
+
+    loaded, meta = nd.load_project(path)
+    assert meta["symbols"] == editor.symbol_of
+    assert nd.project_legend_map(meta)["symbol_of"] == editor.symbol_of
+    assert np.array_equal(loaded.indices, editor.pattern.indices)
+
+
+def test_export_from_project_reuses_stored_legend(tmp_path, monkeypatch):
+    nd.load_dmc_palette(PALETTE_CSV, use_cache=False)
+    pattern = small_pattern()
+    symbol_of = list(reversed(nd.build_palette_map(pattern)[1]))
+    path = str(tmp_path / "p.loom")
+    nd.save_project(path, pattern, allow_specialty=False, distance="de76", symbol_of=symbol_of)
+    expected = nd.legend_dmc_rows(pattern, np.arange(6), True, False, "de76", cache=None)
+
+    loaded, meta = nd.load_project(path)
+    stored = nd.project_legend_map(meta, allow_specialty=False, distance="de76")
+    assert np.array_equal(stored["dmc_of"], expected)
+    assert "dmc_of" not in nd.project_legend_map(meta, allow_specialty=True, distance="de76")
+
+    def no_matching(*args, **kwargs):
+        raise AssertionError("DMC matching should come from the project")
+
+    monkeypatch.setattr(nd, "legend_dmc_rows", no_matching)
+    written = nd.export_pattern(
+        loaded,
+        str(tmp_path / "p"),
+        allow_specialty=False,
+        distance="de76",
+        export_color=False,
+        export_symbols=False,
+        **stored,
+    )
+    with open(written["legend"], newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    order = nd.build_palette_map(loaded)[0]
+    assert [row["symbol"] for row in rows] == [symbol_of[i] for i in order]
+    assert [row["dmc_code"] for row in rows] == [nd.dmc_info(int(expected[i]))[0] for i in order]
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+import needlepoint_server as server
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "quantizer=bogus",
+        "dither=sideways",
+        "backend=svg",
+        "distance=lab",
+        "color_count=0",
+        "grid_max=-5",
+        "cell_px=1000",
+        "cleanup=1.5",
+        "cleanup=nan",
+        "outputs=legend,poster",
+        "colour_count=4",
+    ],
+)
+def test_bad_settings_are_rejected(query):
+    with pytest.raises(ValueError):
+        server.parse_settings(query)
+
+
+def test_settings_are_typed():
+    settings = server.parse_settings("grid_max=120&quantizer=dmc&cleanup=0.5&tiled=yes&outputs=legend,color")
+    assert settings["grid_max"] == 120
+    assert settings["quantizer"] == "dmc"
+    assert settings["cleanup"] == 0.5
+    assert settings["tiled"] is True
+    assert settings["outputs"] == ["legend", "color"]
+
+
+def test_cache_hit_survives_concurrent_trim(tmp_path, monkeypatch):
+    cache = server.ResultCache(str(tmp_path), max_bytes=1 << 20)
+    work = cache.workspace("k")
+    cache.publish("k", work, {"status": "done"})
+
+    def trimmed(path, *args, **kwargs):
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(os, "utime", trimmed)
+    assert cache.get("k") == {"status": "done"}
+
+
+@pytest.fixture
+def service(tmp_path):
+    return server.PatternService(str(tmp_path / "cache"), workers=1)
+
+
+def test_job_keys_outside_the_cache_are_unknown(service, tmp_path, monkeypatch):
+    (tmp_path / server.RESULT_FILE).write_text('{"files": {"legend": "secret.txt"}}')
+    (tmp_path / "secret.txt").write_text("secret")
+    touched = []
+    monkeypatch.setattr(os, "utime", lambda path, *args, **kwargs: touched.append(path))
+    for key in ("..", "../cache", "%2e%2e", "A" * 40):
+        assert service.status(key) is None
+        assert service.artifact_path(key, "legend") is None
+    assert touched == []
+
+
+def test_artifact_must_stay_in_its_job_folder(service):
+    key = "0" * 40
+    work = service.cache.workspace(key)
+    service.cache.publish(key, work, {"files": {"legend": "../../secret.txt", "color": "c.pdf"}})
+    assert service.artifact_path(key, "legend") is None
+    assert service.artifact_path(key, "color") == os.path.join(os.path.realpath(service.cache.path(key)), "c.pdf")
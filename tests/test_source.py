@@ -0,0 +1,40 @@
+import numpy as np
+from PIL import Image
+
+import needlepoint_designer_plus as nd
+
+
+def gradient(w=600, h=450):
+    y, x = np.mgrid[0:h, 0:w]
+    return np.dstack([x * 255 // w, y * 255 // h, (x + y) % 256]).astype(np.uint8)
+
+
+def test_opaque_png_is_reduced_before_converting(tmp_path, monkeypatch):
+    rgb = gradient()
+    Image.fromarray(rgb).save(tmp_path / "rgb.png")
+    alpha = np.full(rgb.shape[:2] + (1,), 255, dtype=np.uint8)
+    Image.fromarray(np.dstack([rgb, alpha])).save(tmp_path / "rgba.png")
+
+    converted = []
+    convert = Image.Image.convert
+
+    def recording_convert(self, mode=None, *args, **kwargs):
+        converted.append((self.mode, mode, self.size))
+        return convert(self, mode, *args, **kwargs)
+
+    monkeypatch.setattr(Image.Image, "convert", recording_convert)
+    small = nd.load_source(str(tmp_path / "rgba.png"), 40, 30)
+    assert ("RGBA", "RGB", (600, 450)) not in converted
+    reference = nd.load_source(str(tmp_path / "rgb.png"), 40, 30)
+    diff = np.abs(np.asarray(small, dtype=int) - np.asarray(reference, dtype=int))
+    assert small.size == (40, 30) and diff.max() <= 8
+
+
+def test_translucent_png_keeps_its_colors(tmp_path):
+    rgb = gradient()
+    alpha = np.zeros(rgb.shape[:2] + (1,), dtype=np.uint8)
+    Image.fromarray(np.dstack([rgb, alpha])).save(tmp_path / "clear.png")
+    Image.fromarray(rgb).save(tmp_path / "rgb.png")
+    clear = nd.load_source(str(tmp_path / "clear.png"), 40, 30)
+    reference = nd.load_source(str(tmp_path / "rgb.png"), 40, 30)
+    assert np.array_equal(np.asarray(clear), np.asarray(reference))